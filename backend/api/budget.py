@@ -0,0 +1,106 @@
+import re
+import warnings
+from collections import Counter
+from contextlib import ContextDecorator
+
+from django.db import connection
+
+from api.const import REPEATED_QUERY_LIMIT
+from api.metrics import QueryTimer
+
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+NUMBER = re.compile(r'\b\d+\b')
+# Transaction control depends on nesting of atomic blocks, not on a view.
+TRANSACTION_STATEMENTS = (
+    'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT'
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudgetWarning(RuntimeWarning):
+    pass
+
+
+def get_sql_shape(sql):
+    """Return SQL with IN lists and inlined numbers collapsed."""
+    return NUMBER.sub('0', IN_LIST.sub('(%s, ...)', sql))
+
+
+class SQLShapeCounter(QueryTimer):
+    """QueryTimer which also counts queries of the same shape.
+
+    Transaction control statements are neither counted nor timed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(TRANSACTION_STATEMENTS):
+            return execute(sql, params, many, context)
+        self.shapes[get_sql_shape(sql)] += 1
+        return super().__call__(execute, sql, params, many, context)
+
+    def get_problems(self, max_queries=None,
+                     repeated_limit=REPEATED_QUERY_LIMIT):
+        problems = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append(
+                f'{self.count} queries, budget is {max_queries}'
+            )
+        if repeated_limit:
+            problems.extend(
+                f'{count} queries of the same shape: {shape}'
+                for shape, count in self.shapes.most_common()
+                if count >= repeated_limit
+            )
+        return problems
+
+
+def report_problems(problems, label, strict=True):
+    if not problems:
+        return
+    message = f'{label}: ' + '; '.join(problems)
+    if strict:
+        raise QueryBudgetExceeded(message)
+    warnings.warn(message, QueryBudgetWarning, stacklevel=3)
+
+
+class query_budget(ContextDecorator):
+    """Fail when block runs more than max_queries or repeats SQL shape.
+
+    Usable as decorator or context manager:
+
+        with query_budget(4):
+            client.get('/api/recipes/')
+
+    strict=False issues QueryBudgetWarning instead of raising.
+    """
+
+    def __init__(self, max_queries=None, repeated_limit=REPEATED_QUERY_LIMIT,
+                 strict=True, label='query budget'):
+        self.max_queries = max_queries
+        self.repeated_limit = repeated_limit
+        self.strict = strict
+        self.label = label
+
+    def __enter__(self):
+        self.counter = SQLShapeCounter()
+        self.wrapper = connection.execute_wrapper(self.counter)
+        self.wrapper.__enter__()
+        return self.counter
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wrapper.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            report_problems(
+                self.counter.get_problems(
+                    self.max_queries, self.repeated_limit
+                ),
+                self.label,
+                self.strict
+            )
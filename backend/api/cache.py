@@ -0,0 +1,142 @@
+import time
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from api.const import CATALOG_BODY_TIMEOUT, RECIPE_CARD_TIMEOUT
+from api.serializers import (
+    RecipeSerializer,
+    get_recipe_prefetch,
+    get_subscribed_ids
+)
+from recipes.models import CatalogVersion, Favorite, Recipe, Shop
+
+RECIPE_CARD_VERSION_KEY = 'recipe_card_version'
+
+
+def get_recipe_card_version():
+    return cache.get_or_set(RECIPE_CARD_VERSION_KEY, 1, timeout=None)
+
+
+def bump_recipe_card_version():
+    """Invalidate every cached recipe card at once."""
+    try:
+        cache.incr(RECIPE_CARD_VERSION_KEY)
+    except ValueError:
+        cache.set(RECIPE_CARD_VERSION_KEY, 1, timeout=None)
+
+
+def get_recipe_card_keys(recipe_ids):
+    version = get_recipe_card_version()
+    return {
+        recipe_id: f'recipe_card:{version}:{recipe_id}'
+        for recipe_id in recipe_ids
+    }
+
+
+def invalidate_recipe_cards(recipe_ids):
+    cache.delete_many(get_recipe_card_keys(recipe_ids).values())
+
+
+def get_recipe_cards(recipe_ids):
+    """Return request independent RecipeSerializer data in ids order.
+
+    Cards missing in cache are serialized from one prefetched queryset
+    and stored. Image urls stay relative and per-user fields keep their
+    defaults, see personalize_recipe_cards().
+    """
+    keys = get_recipe_card_keys(recipe_ids)
+    cached = cache.get_many(keys.values())
+    cards = {
+        recipe_id: cached[key]
+        for recipe_id, key in keys.items()
+        if key in cached
+    }
+    missing = [recipe_id for recipe_id in recipe_ids if recipe_id not in cards]
+    if missing:
+        recipes = Recipe.objects.filter(id__in=missing).select_related(
+            'author'
+        ).prefetch_related(*get_recipe_prefetch())
+        fresh = {
+            card['id']: card
+            for card in RecipeSerializer(
+                recipes,
+                many=True,
+                context={'request': None}
+            ).data
+        }
+        cache.set_many(
+            {keys[recipe_id]: card for recipe_id, card in fresh.items()},
+            timeout=RECIPE_CARD_TIMEOUT
+        )
+        cards.update(fresh)
+    return [cards[recipe_id] for recipe_id in recipe_ids if recipe_id in cards]
+
+
+def personalize_recipe_cards(cards, request):
+    """Overlay absolute urls and request user state on cached cards."""
+    user = request.user
+    favorited = in_shopping_cart = ()
+    if user.is_authenticated:
+        recipe_ids = [card['id'] for card in cards]
+        favorited = set(Favorite.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+        in_shopping_cart = set(Shop.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True))
+    subscribed_ids = get_subscribed_ids(request)
+    return [
+        {
+            **card,
+            'author': {
+                **card['author'],
+                'is_subscribed': card['author']['id'] in subscribed_ids,
+                'avatar': card['author']['avatar'] and (
+                    request.build_absolute_uri(card['author']['avatar'])
+                ),
+            },
+            'is_favorited': card['id'] in favorited,
+            'is_in_shopping_cart': card['id'] in in_shopping_cart,
+            'image': card['image'] and request.build_absolute_uri(
+                card['image']
+            ),
+        }
+        for card in cards
+    ]
+
+
+def get_catalog_version(catalog):
+    """Return version of tag or ingredient catalog.
+
+    Version is the time of the last change in microseconds, so it also
+    serves as Last-Modified value. It is read from CatalogVersion on
+    every call: a version cached per process would miss bumps made by
+    load_ingredients, import_recipes or another worker.
+    """
+    version = CatalogVersion.objects.filter(
+        catalog=catalog
+    ).values_list('version', flat=True).first()
+    if version is None:
+        version = CatalogVersion.objects.get_or_create(
+            catalog=catalog,
+            defaults={'version': time.time_ns() // 1000}
+        )[0].version
+    return version
+
+
+def bump_catalog_version(catalog):
+    CatalogVersion.objects.update_or_create(
+        catalog=catalog,
+        defaults={'version': time.time_ns() // 1000}
+    )
+
+
+def get_catalog_body(catalog, version, get_data):
+    """Return encoded JSON of whole catalog, rendered once per version."""
+    key = f'catalog_body:{catalog}:{version}'
+    body = cache.get(key)
+    if body is None:
+        body = JSONRenderer().render(get_data())
+        cache.set(key, body, timeout=CATALOG_BODY_TIMEOUT)
+    return body
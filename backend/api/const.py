@@ -1,4 +1,87 @@
 SUBSCRIPTION_AMOUNT_RECIPE = 10
 MIN_VALUE = 1
 MAX_VALUE = 32767
+# Range of BigAutoField primary keys, larger ids overflow in queries.
+MAX_ID = 2 ** 63 - 1
 RECIPES_LIMIT = 6
+RECIPE_CARD_TIMEOUT = 60 * 60 * 24
+CATALOG_BODY_TIMEOUT = 60 * 60 * 24
+CATALOG_MAX_AGE = 60 * 60
+INGREDIENT_SEARCH_LIMIT = 50
+# Shorter names only get prefix matches, trigram index can not serve
+# substring search for them.
+INGREDIENT_SUBSTRING_MIN_LENGTH = 3
+PAGINATION_PARAM = 'pagination'
+CURSOR_PAGINATION = 'cursor'
+SHOP_LIST_HEADER = ('название', 'ед.изм.', 'кол-во')
+SHOP_LIST_FILENAME = 'shopping_list'
+BULK_RECIPES_LIMIT = 100
+BULK_ADDED = 'added'
+BULK_ALREADY_ADDED = 'already_added'
+BULK_REMOVED = 'removed'
+BULK_NOT_ADDED = 'not_added'
+BULK_NOT_FOUND = 'not_found'
+COOK_INGREDIENTS_LIMIT = 100
+# Pending recipe changes applied to in-memory cook index, more changes
+# or expired ones rebuild the index.
+COOK_CHANGES_LIMIT = 1000
+COOK_CHANGE_TIMEOUT = 60 * 60 * 24
+METRICS_PREFIX = 'foodgram'
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+RESPONSE_SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304
+)
+REPEATED_QUERY_LIMIT = 3
+# Max SQL queries per route with cold caches, checked by
+# check_query_budgets and QueryBudgetMiddleware.
+QUERY_BUDGETS = {
+    'APIRootView.get': 1,
+    'TokenCreateView.post': 4,
+    'TokenDestroyView.post': 2,
+    'TagViewSet.list': 3,
+    'TagViewSet.retrieve': 2,
+    'IngredientViewSet.list': 3,
+    'IngredientViewSet.retrieve': 2,
+    'FoodUserViewSet.list': 4,
+    'FoodUserViewSet.create': 4,
+    'FoodUserViewSet.retrieve': 3,
+    'FoodUserViewSet.update': 6,
+    'FoodUserViewSet.partial_update': 5,
+    'FoodUserViewSet.destroy': 14,
+    'FoodUserViewSet.me': 4,
+    'FoodUserViewSet.me_avatar': 3,
+    'FoodUserViewSet.delete_me_avatar': 3,
+    'FoodUserViewSet.activation': 3,
+    'FoodUserViewSet.resend_activation': 2,
+    'FoodUserViewSet.reset_password': 2,
+    'FoodUserViewSet.reset_password_confirm': 3,
+    'FoodUserViewSet.reset_username': 2,
+    'FoodUserViewSet.reset_username_confirm': 3,
+    'FoodUserViewSet.set_password': 3,
+    'FoodUserViewSet.set_username': 4,
+    'FoodUserViewSet.subscriptions': 5,
+    'FoodUserViewSet.create_subscription': 5,
+    'FoodUserViewSet.delete_subscription': 3,
+    'RecipeViewSet.list': 10,
+    'RecipeViewSet.create': 12,
+    'RecipeViewSet.retrieve': 5,
+    'RecipeViewSet.update': 2,
+    'RecipeViewSet.partial_update': 15,
+    'RecipeViewSet.destroy': 19,
+    'RecipeViewSet.get_short_link': 2,
+    'RecipeViewSet.add_favorite': 3,
+    'RecipeViewSet.delete_favorite': 3,
+    'RecipeViewSet.add_shop': 4,
+    'RecipeViewSet.delete_shop': 5,
+    'RecipeViewSet.add_favorites': 4,
+    'RecipeViewSet.delete_favorites': 4,
+    'RecipeViewSet.add_shops': 5,
+    'RecipeViewSet.delete_shops': 6,
+    'RecipeViewSet.clear_shop': 4,
+    'RecipeViewSet.download_shopping_cart': 2,
+    'RecipeViewSet.cook': 10,
+    'RecipeViewSet.similar': 3,
+}
@@ -0,0 +1,240 @@
+import threading
+from itertools import chain
+
+import numpy as np
+from django.core.cache import cache
+
+from api.cache import get_recipe_card_version
+from api.const import COOK_CHANGE_TIMEOUT, COOK_CHANGES_LIMIT
+from recipes.models import Recipe, RecipeIngredientsAmount, Tag
+
+COOK_CHANGES_KEY = 'cook_index_changes'
+
+
+def fetch_postings(queryset, key):
+    """Return {key: sorted int32 array of recipe ids} with one query."""
+    pairs = np.fromiter(
+        chain.from_iterable(
+            queryset.order_by(key, 'recipe_id').values_list(
+                key, 'recipe_id'
+            ).iterator()
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    keys, starts = np.unique(pairs[:, 0], return_index=True)
+    return dict(zip(
+        keys.tolist(),
+        np.split(pairs[:, 1].astype(np.int32), starts[1:])
+    ))
+
+
+def count_recipe_ingredients(postings, size):
+    sizes = np.zeros(size, dtype=np.uint16)
+    for posting in postings.values():
+        sizes[posting] += 1
+    return sizes
+
+
+def update_postings(postings, changed, fresh):
+    """Return copy of postings with changed recipe ids replaced by fresh.
+
+    Only arrays holding changed recipes are copied.
+    """
+    postings = dict(postings)
+    for key, posting in tuple(postings.items()):
+        positions = np.searchsorted(posting, changed)
+        found = positions[
+            posting[np.minimum(positions, len(posting) - 1)] == changed
+        ]
+        added = fresh.pop(key, None)
+        if not len(found) and added is None:
+            continue
+        posting = np.delete(posting, found)
+        if added is not None:
+            posting = np.insert(
+                posting, np.searchsorted(posting, added), added
+            )
+        if len(posting):
+            postings[key] = posting
+        else:
+            del postings[key]
+    postings.update(fresh)
+    return postings
+
+
+class RankedRecipes:
+    """Recipes found by CookIndex, sliced in rank order.
+
+    Arrays are indexed by recipe id. Only requested slice is sorted, so
+    paginator pages stay cheap for any number of found recipes.
+    """
+
+    def __init__(self, covered, sizes, found):
+        self.covered = covered
+        self.sizes = sizes
+        self.coverage = np.divide(
+            covered, sizes, out=np.full(len(sizes), -1.0), where=found
+        )
+        self.count = int(np.count_nonzero(found))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, page):
+        top = min(page.stop, self.count)
+        if top <= page.start:
+            return []
+        # All ties of the last coverage value take part in sorting.
+        last = np.partition(-self.coverage, top - 1)[top - 1]
+        recipe_ids = np.flatnonzero(-self.coverage <= last)
+        coverage = self.coverage[recipe_ids]
+        missing = (
+            self.sizes[recipe_ids].astype(np.int64)
+            - self.covered[recipe_ids]
+        )
+        order = np.lexsort((-recipe_ids, missing, -coverage))
+        return [
+            {
+                'id': int(recipe_ids[position]),
+                'coverage': round(float(coverage[position]), 3),
+                'missing_ingredients': int(missing[position]),
+            }
+            for position in order[page.start:top]
+        ]
+
+
+class CookIndex:
+    """Inverted index ingredient id -> sorted array of recipe ids.
+
+    Recipes are ranked by the share of their ingredients which user has.
+    Index is immutable, apply() returns updated copy.
+    """
+
+    def __init__(self, postings, tag_postings, sizes, tag_ids):
+        self.postings = postings
+        self.tag_postings = tag_postings
+        self.sizes = sizes
+        self.tag_ids = tag_ids
+
+    @classmethod
+    def build(cls):
+        postings = fetch_postings(
+            RecipeIngredientsAmount.objects.all(), 'ingredient_id'
+        )
+        tag_postings = fetch_postings(
+            Recipe.tags.through.objects.all(), 'tag_id'
+        )
+        # Recipes may have tags without ingredients.
+        size = max(
+            (
+                int(posting[-1])
+                for posting in chain(
+                    postings.values(), tag_postings.values()
+                )
+            ),
+            default=0
+        ) + 1
+        return cls(
+            postings,
+            tag_postings,
+            count_recipe_ingredients(postings, size),
+            dict(Tag.objects.values_list('slug', 'id')),
+        )
+
+    def apply(self, recipe_ids):
+        """Return index with recipes reloaded from database."""
+        changed = np.array(sorted(recipe_ids), dtype=np.int32)
+        fresh = fetch_postings(
+            RecipeIngredientsAmount.objects.filter(recipe_id__in=changed),
+            'ingredient_id'
+        )
+        sizes = np.zeros(
+            max(len(self.sizes), int(changed[-1]) + 1), dtype=np.uint16
+        )
+        sizes[:len(self.sizes)] = self.sizes
+        sizes[changed] = count_recipe_ingredients(fresh, len(sizes))[changed]
+        return CookIndex(
+            update_postings(self.postings, changed, fresh),
+            update_postings(
+                self.tag_postings,
+                changed,
+                fetch_postings(
+                    Recipe.tags.through.objects.filter(
+                        recipe_id__in=changed
+                    ),
+                    'tag_id'
+                )
+            ),
+            sizes,
+            self.tag_ids,
+        )
+
+    def search(self, ingredients, max_missing=None, tags=()):
+        """Return RankedRecipes having at least one of ingredients.
+
+        max_missing limits number of ingredients user lacks, tags keep
+        recipes with any of the tag slugs, like RecipeFilter does.
+        """
+        postings = [
+            self.postings[ingredient_id]
+            for ingredient_id in set(ingredients)
+            if ingredient_id in self.postings
+        ]
+        if not postings:
+            postings = [np.empty(0, dtype=np.int32)]
+        covered = np.bincount(
+            np.concatenate(postings), minlength=len(self.sizes)
+        )
+        found = covered > 0
+        if max_missing is not None:
+            found &= self.sizes <= covered + max_missing
+        if tags:
+            tagged = np.zeros(len(self.sizes), dtype=bool)
+            for slug in set(tags):
+                posting = self.tag_postings.get(self.tag_ids.get(slug))
+                if posting is not None:
+                    tagged[posting] = True
+            found &= tagged
+        return RankedRecipes(covered, self.sizes, found)
+
+
+def record_recipe_change(recipe_id):
+    """Log changed recipe for cook indexes of all processes."""
+    cache.add(COOK_CHANGES_KEY, 0, timeout=None)
+    number = cache.incr(COOK_CHANGES_KEY)
+    cache.set(
+        f'{COOK_CHANGES_KEY}:{number}', recipe_id, timeout=COOK_CHANGE_TIMEOUT
+    )
+
+
+_index = (None, 0, None)
+_lock = threading.Lock()
+
+
+def get_cook_index():
+    """Return cook index of this process, brought up to date.
+
+    Logged recipe changes are applied incrementally. Index is rebuilt
+    when recipe card version is bumped, e.g. by generate_dataset and
+    import_recipes, or when change log is too long or expired.
+    """
+    global _index
+    with _lock:
+        version = get_recipe_card_version()
+        changes = cache.get(COOK_CHANGES_KEY, 0)
+        index_version, applied, index = _index
+        if (
+            index_version != version
+            or not applied <= changes <= applied + COOK_CHANGES_LIMIT
+        ):
+            _index = (version, changes, CookIndex.build())
+        elif changes > applied:
+            keys = [
+                f'{COOK_CHANGES_KEY}:{number}'
+                for number in range(applied + 1, changes + 1)
+            ]
+            recipe_ids = cache.get_many(keys)
+            _index = (version, changes, index.apply(
+                set(recipe_ids.values())
+            ) if len(recipe_ids) == len(keys) else CookIndex.build())
+        return _index[2]
@@ -0,0 +1,85 @@
+from rest_framework import serializers
+
+from api.const import MAX_ID
+
+DOES_NOT_EXIST = serializers.PrimaryKeyRelatedField.default_error_messages[
+    'does_not_exist'
+]
+
+
+def resolve_ids(queryset, ids):
+    """Return {id: object} for ids with one id__in query.
+
+    Raise ValidationError {position: [message]} for every missing id.
+    """
+    objects = queryset.in_bulk(set(ids))
+    errors = {
+        position: [DOES_NOT_EXIST.format(pk_value=pk)]
+        for position, pk in enumerate(ids)
+        if pk not in objects
+    }
+    if errors:
+        raise serializers.ValidationError(errors)
+    return objects
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """List of primary keys resolved to objects with one query."""
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        kwargs.setdefault(
+            'child', serializers.IntegerField(min_value=1, max_value=MAX_ID)
+        )
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        objects = resolve_ids(self.queryset.all(), ids)
+        return [objects[pk] for pk in ids]
+
+    def to_representation(self, data):
+        return [obj.pk for obj in data]
+
+
+class BulkPrimaryKeyRelatedField(serializers.IntegerField):
+    """Primary key inside nested serializer with many=True.
+
+    The field keeps the id, BulkRelatedListSerializer of the nested
+    serializer replaces ids of all items by objects with one query.
+    """
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        kwargs.setdefault('min_value', 1)
+        kwargs.setdefault('max_value', MAX_ID)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return getattr(value, 'pk', value)
+
+
+class BulkRelatedListSerializer(serializers.ListSerializer):
+    """Resolve BulkPrimaryKeyRelatedField values of all items at once.
+
+    Set as Meta.list_serializer_class of the nested serializer.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        errors = [{} for _ in items]
+        for name, field in self.child.fields.items():
+            if not isinstance(field, BulkPrimaryKeyRelatedField):
+                continue
+            ids = [item[field.source] for item in items]
+            try:
+                objects = resolve_ids(field.queryset.all(), ids)
+            except serializers.ValidationError as error:
+                for position, messages in error.detail.items():
+                    errors[position][name] = messages
+                continue
+            for item in items:
+                item[field.source] = objects[item[field.source]]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
@@ -1,5 +1,6 @@
 from django_filters import rest_framework as filters
 
+from api.search import search_recipes
 from recipes.models import (
     Recipe,
     Tag
@@ -18,6 +19,9 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(
         method='filter_is_favorite'
     )
+    search = filters.CharFilter(
+        method='filter_search'
+    )
 
     class Meta:
         model = Recipe
@@ -37,3 +41,8 @@ class RecipeFilter(filters.FilterSet):
         if user.is_authenticated and value:
             return queryset.filter(favorite_set__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        # Ranked order is kept by page pagination, cursor pagination
+        # orders found recipes by date.
+        return search_recipes(queryset, value)
@@ -0,0 +1,239 @@
+import itertools
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.budget import SQLShapeCounter
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import FoodUser
+
+FILTERS = (
+    ('author', '{author}'),
+    ('tags', '{tag}'),
+    ('is_favorited', '1'),
+    ('is_in_shopping_cart', '1'),
+)
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark API endpoints in-process on current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--output',
+            default='benchmark.json',
+            help='JSON файл с результатами.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON файл прошлого запуска для сравнения.'
+        )
+        parser.add_argument(
+            '--only',
+            help='Запускать только эндпоинты, содержащие подстроку.'
+        )
+
+    def handle(self, *args, **options):
+        user = FoodUser.objects.annotate(
+            carts=Count('shop_set')
+        ).order_by('-carts', 'id').first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        tag = Tag.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if None in (user, recipe, tag, ingredient):
+            raise CommandError(
+                'База пуста, выполните load_ingredients и generate_dataset.'
+            )
+        author = recipe.author
+        # Undo requests may answer 400, it is expected.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        baseline = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = {
+                    result['name']: result
+                    for result in json.load(f)['results']
+                }
+        token, created = Token.objects.get_or_create(user=user)
+        self.anonymous = Client(SERVER_NAME='localhost')
+        self.client = Client(
+            SERVER_NAME='localhost',
+            HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+        params = {'author': author.id, 'tag': tag.slug}
+        results = []
+        try:
+            for name, method, url, authorized, undo in self.get_endpoints(
+                params, recipe, author, ingredient
+            ):
+                if options['only'] and options['only'] not in name:
+                    continue
+                measure = self.measure_rolled_back if undo else self.measure
+                results.append(measure(
+                    method, url, authorized, undo,
+                    options['repeat'], options['warmup']
+                ))
+                self.report(name, results[-1], baseline.get(name))
+        finally:
+            if created:
+                token.delete()
+        with open(options['output'], mode='w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'commit': self.get_commit(),
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'dataset': {
+                        'users': FoodUser.objects.count(),
+                        'recipes': Recipe.objects.count(),
+                        'ingredients': Ingredient.objects.count(),
+                    },
+                    'results': results,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2
+            )
+        self.stdout.write(f'Результаты записаны в {options["output"]}.')
+
+    def report(self, name, result, previous):
+        result['name'] = name
+        self.stdout.write(
+            f'{name:60} {result["status"]} '
+            f'p50 {result["p50_ms"]:7.2f} p95 {result["p95_ms"]:7.2f} '
+            f'p99 {result["p99_ms"]:7.2f} ms '
+            f'{result["rps"]:7.1f} rps '
+            f'{result["queries"]:4} q {result["sql_ms"]:6.2f} ms sql'
+            + self.get_difference(result, previous)
+        )
+
+    @staticmethod
+    def get_endpoints(params, recipe, author, ingredient):
+        """Yield (name, method, url, authorized, undo request)."""
+        for authorized in (False, True):
+            prefix = 'auth' if authorized else 'anon'
+            yield f'{prefix} recipes list', 'get', '/api/recipes/', \
+                authorized, None
+            for size in range(1, len(FILTERS) + 1):
+                for combination in itertools.combinations(FILTERS, size):
+                    query = '&'.join(
+                        f'{key}={value.format(**params)}'
+                        for key, value in combination
+                    )
+                    yield (
+                        f'{prefix} recipes list ?{query}', 'get',
+                        f'/api/recipes/?{query}', authorized, None
+                    )
+            yield (f'{prefix} recipes list ?pagination=cursor', 'get',
+                   '/api/recipes/?pagination=cursor', authorized, None)
+            yield (f'{prefix} recipe detail', 'get',
+                   f'/api/recipes/{recipe.id}/', authorized, None)
+            yield f'{prefix} users list', 'get', '/api/users/', \
+                authorized, None
+            yield f'{prefix} tags', 'get', '/api/tags/', authorized, None
+            yield f'{prefix} ingredients', 'get', '/api/ingredients/', \
+                authorized, None
+            for length in (1, 3, 6):
+                name = ingredient.name[:length]
+                yield (f'{prefix} ingredients ?name={name}', 'get',
+                       f'/api/ingredients/?name={name}', authorized, None)
+        yield 'auth users me', 'get', '/api/users/me/', True, None
+        yield ('auth subscriptions', 'get',
+               '/api/users/subscriptions/?recipes_limit=3', True, None)
+        yield ('auth download shopping cart', 'get',
+               '/api/recipes/download_shopping_cart/', True, None)
+        for action in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{recipe.id}/{action}/'
+            yield f'auth {action} add', 'post', url, True, ('delete', url)
+        url = f'/api/users/{author.id}/subscribe/'
+        yield 'auth subscribe add', 'post', url, True, ('delete', url)
+
+    def measure(self, method, url, authorized, undo, repeat, warmup):
+        """Run request repeat times, return latency and SQL statistics."""
+        client = self.client if authorized else self.anonymous
+        timings = []
+        queries = []
+        sql_time = []
+        status = None
+        for attempt in range(warmup + repeat):
+            if undo:
+                # Writes are measured on clean state, undo is not timed.
+                self.request(client, *undo)
+            timer = SQLShapeCounter()
+            with connection.execute_wrapper(timer):
+                start = time.perf_counter()
+                status = self.request(client, method, url)
+                elapsed = time.perf_counter() - start
+            if attempt >= warmup:
+                timings.append(elapsed)
+                queries.append(timer.count)
+                sql_time.append(timer.duration)
+        if undo:
+            self.request(client, *undo)
+        timings.sort()
+        return {
+            'method': method.upper(),
+            'url': url,
+            'status': status,
+            'repeat': repeat,
+            'p50_ms': statistics.median(timings) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'rps': repeat / sum(timings),
+            'queries': max(queries),
+            'sql_ms': statistics.median(sql_time) * 1000,
+        }
+
+    def measure_rolled_back(self, *args):
+        """Measure writes in transaction which is rolled back.
+
+        Benchmark user may already have the recipe in favorites or cart,
+        undo requests must not remove it for good. Timings do not include
+        commits.
+        """
+        with transaction.atomic():
+            result = self.measure(*args)
+            transaction.set_rollback(True)
+        return result
+
+    @staticmethod
+    def get_difference(result, previous):
+        if previous is None:
+            return ''
+        change = (result['p50_ms'] / previous['p50_ms'] - 1) * 100
+        return (f' | p50 {change:+.0f}%, '
+                f'{result["queries"] - previous["queries"]:+d} q')
+
+    @staticmethod
+    def request(client, method, url):
+        response = getattr(client, method)(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', 'HEAD'),
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,68 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.const import RECIPES_LIMIT
+from api.cook import CookIndex
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure build time, size and search latency of cook index. For '
+        '1M recipes fill database by generate_dataset --recipes 1000000.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=(5, 10, 20),
+            help='Numbers of ingredients user has.'
+        )
+        parser.add_argument('--queries', type=int, default=100)
+        parser.add_argument('--max-missing', type=int, default=None)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = CookIndex.build()
+        elapsed = time.perf_counter() - start
+        if not index.postings:
+            self.stdout.write('Рецептов нет, выполните generate_dataset.')
+            return
+        size = index.sizes.nbytes + sum(
+            posting.nbytes
+            for postings in (index.postings, index.tag_postings)
+            for posting in postings.values()
+        )
+        self.stdout.write(
+            f'{int((index.sizes > 0).sum())} recipes indexed in '
+            f'{elapsed:.1f} s, {size / 2 ** 20:.1f} MiB'
+        )
+        rng = random.Random(options['seed'])
+        ingredient_ids = list(index.postings)
+        # Users have common ingredients more often than rare ones.
+        weights = [len(posting) for posting in index.postings.values()]
+        for count in options['sizes']:
+            timings = []
+            for _ in range(options['queries']):
+                ingredients = set()
+                while len(ingredients) < min(count, len(ingredient_ids)):
+                    ingredients.update(rng.choices(
+                        ingredient_ids, weights, k=count - len(ingredients)
+                    ))
+                start = time.perf_counter()
+                index.search(
+                    ingredients, options['max_missing']
+                )[0:RECIPES_LIMIT]
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            self.stdout.write(
+                f'{count} ingredients: {len(timings)} queries, '
+                f'p50 {statistics.median(timings) * 1e3:.1f} ms, '
+                f'p95 {timings[int(len(timings) * 0.95)] * 1e3:.1f} ms, '
+                f'max {timings[-1] * 1e3:.1f} ms'
+            )
@@ -0,0 +1,71 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.search import INGREDIENT_FIELDS, IngredientIndex, search_ingredients
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Measure per-keystroke latency of ingredient autocomplete'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale',
+            nargs='+',
+            type=int,
+            default=(1, 100),
+            help='Catalog size multipliers for in-memory index.'
+        )
+        parser.add_argument('--words', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def report(self, title, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f'{title}: {len(timings)} keystrokes, '
+            f'p50 {statistics.median(timings) * 1e6:.0f} us, '
+            f'p95 {timings[int(len(timings) * 0.95)] * 1e6:.0f} us, '
+            f'max {timings[-1] * 1e6:.0f} us'
+        )
+
+    def handle(self, *args, **options):
+        ingredients = list(Ingredient.objects.values(*INGREDIENT_FIELDS))
+        if not ingredients:
+            self.stdout.write('Каталог пуст, выполните load_ingredients.')
+            return
+        rng = random.Random(options['seed'])
+        words = [
+            ingredient['name']
+            for ingredient in rng.choices(ingredients, k=options['words'])
+        ]
+        keystrokes = [
+            word[:end] for word in words for end in range(1, len(word) + 1)
+        ]
+        for scale in options['scale']:
+            catalog = [
+                {**ingredient, 'name': f'{ingredient["name"]} {copy}'}
+                if copy else ingredient
+                for copy in range(scale)
+                for ingredient in ingredients
+            ]
+            start = time.perf_counter()
+            index = IngredientIndex(catalog)
+            self.stdout.write(
+                f'index x{scale} ({len(catalog)} rows) built in '
+                f'{time.perf_counter() - start:.3f} s'
+            )
+            timings = []
+            for keystroke in keystrokes:
+                start = time.perf_counter()
+                index.search(keystroke)
+                timings.append(time.perf_counter() - start)
+            self.report(f'index x{scale}', timings)
+        timings = []
+        for keystroke in keystrokes:
+            start = time.perf_counter()
+            search_ingredients(keystroke)
+            timings.append(time.perf_counter() - start)
+        self.report('search_ingredients', timings)
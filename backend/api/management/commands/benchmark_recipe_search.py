@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Q
+
+from api.const import RECIPES_LIMIT
+from api.search import WORD, search_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency of ?search= page with count. For 1M recipes fill '
+        'database by generate_dataset --recipes 1000000.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=RECIPES_LIMIT)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--baseline',
+            action='store_true',
+            help='Also measure icontains over name and text.'
+        )
+
+    def report(self, title, result):
+        timings, found = result
+        timings = sorted(timings)
+        self.stdout.write(
+            f'{title}: {len(timings)} queries, '
+            f'{statistics.mean(found):.0f} found on average, '
+            f'p50 {statistics.median(timings) * 1e3:.1f} ms, '
+            f'p95 {timings[int(len(timings) * 0.95)] * 1e3:.1f} ms, '
+            f'max {timings[-1] * 1e3:.1f} ms'
+        )
+
+    def measure(self, queries, get_queryset, limit):
+        timings, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            queryset = get_queryset(query)
+            found.append(queryset.count())
+            list(queryset.values_list('id', flat=True)[:limit])
+            timings.append(time.perf_counter() - start)
+        return timings, found
+
+    def handle(self, *args, **options):
+        last = Recipe.objects.aggregate(last=Max('id'))['last']
+        if last is None:
+            self.stdout.write('Рецептов нет, выполните generate_dataset.')
+            return
+        rng = random.Random(options['seed'])
+        names = list(Recipe.objects.filter(id__in=[
+            rng.randint(1, last) for _ in range(options['queries'])
+        ]).values_list('name', flat=True))
+        # One word and two words queries from existing names.
+        queries = [
+            ' '.join(rng.sample(words, min(len(words), rng.randint(1, 2))))
+            for words in map(WORD.findall, names) if words
+        ]
+        self.stdout.write(f'{Recipe.objects.count()} recipes')
+        self.report('search', self.measure(
+            queries,
+            lambda query: search_recipes(Recipe.objects.all(), query),
+            options['limit']
+        ))
+        if options['baseline']:
+            self.report('icontains', self.measure(
+                queries,
+                lambda query: Recipe.objects.filter(
+                    Q(name__icontains=query) | Q(text__icontains=query)
+                ).order_by('-created_at', '-id'),
+                options['limit']
+            ))
@@ -0,0 +1,270 @@
+import logging
+from urllib.parse import urlencode
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import URLPattern, get_resolver
+from rest_framework.authtoken.models import Token
+
+from api.budget import SQLShapeCounter
+from api.cache import bump_catalog_version, bump_recipe_card_version
+from api.const import QUERY_BUDGETS
+from api.metrics import get_route
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import FoodUser
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+PASSWORD = 'budget-Passw0rd'
+
+
+def get_api_routes(patterns=None, prefix=''):
+    """Yield route labels of every view under api/."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        path = prefix + str(pattern.pattern)
+        if not isinstance(pattern, URLPattern):
+            yield from get_api_routes(pattern.url_patterns, path)
+            continue
+        view = getattr(pattern.callback, 'cls', None)
+        if view is None or not path.startswith('api/'):
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        if actions:
+            yield from (f'{view.__name__}.{name}' for name in actions.values())
+            continue
+        for method in view.http_method_names:
+            if method != 'options' and hasattr(view, method):
+                yield f'{view.__name__}.{method}'
+
+
+class Command(BaseCommand):
+    help = 'Request every API route and check QUERY_BUDGETS and N+1'
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.order_by('id').first()
+        tags = list(Tag.objects.order_by('id')[:2])
+        ingredients = list(Ingredient.objects.order_by('id')[:2])
+        if recipe is None or len(tags) < 2 or len(ingredients) < 2:
+            raise CommandError(
+                'База пуста, выполните load_ingredients и generate_dataset.'
+            )
+        # Expected 4xx of invalid djoser payloads are not interesting.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        self.failures = []
+        self.checked = set()
+        self.files = []
+        try:
+            with transaction.atomic():
+                self.run_requests(recipe, tags, ingredients)
+                transaction.set_rollback(True)
+        finally:
+            for name in self.files:
+                default_storage.delete(name)
+            bump_recipe_card_version()
+        missing = set(get_api_routes()) - self.checked
+        self.failures.extend(
+            f'{route}: no request checks it' for route in sorted(missing)
+        )
+        self.failures.extend(
+            f'{route}: no budget in QUERY_BUDGETS'
+            for route in sorted(set(get_api_routes()) - QUERY_BUDGETS.keys())
+        )
+        if self.failures:
+            raise CommandError('\n'.join(self.failures))
+        self.stdout.write(f'Проверено маршрутов: {len(self.checked)}.')
+
+    def check_route(self, client, route, method, url, data=None):
+        # Budgets hold for cold caches.
+        bump_catalog_version('tag')
+        bump_catalog_version('ingredient')
+        bump_recipe_card_version()
+        counter = SQLShapeCounter()
+        with connection.execute_wrapper(counter):
+            response = getattr(client, method)(
+                url, data, content_type='application/json'
+            ) if data is not None else getattr(client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        resolved = get_route(response.wsgi_request)
+        budget = QUERY_BUDGETS.get(resolved)
+        problems = counter.get_problems(budget)
+        if resolved != route:
+            problems.append(f'{method.upper()} {url} resolved to {resolved}')
+        self.checked.add(resolved)
+        self.stdout.write(
+            f'{route:45} {method.upper():6} {response.status_code} '
+            f'{counter.count:3}/{budget} {"FAIL" if problems else "OK"}  '
+            f'{url}'
+        )
+        self.failures.extend(f'{route}: {problem}' for problem in problems)
+        return response
+
+    def run_requests(self, recipe, tags, ingredients):
+        tag = tags[0]
+        user = FoodUser.objects.create_user(
+            email='budget@example.com', username='budget_user',
+            first_name='Бюджет', last_name='Запросов', password=PASSWORD
+        )
+        author = recipe.author
+        anonymous = Client(SERVER_NAME='localhost')
+        client = Client(
+            SERVER_NAME='localhost',
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+        )
+        check = self.check_route
+        for current in (anonymous, client):
+            check(current, 'APIRootView.get', 'get', '/api/')
+            check(current, 'TagViewSet.list', 'get', '/api/tags/')
+            check(current, 'TagViewSet.retrieve', 'get',
+                  f'/api/tags/{tag.id}/')
+            for query in ('', f'?name={ingredients[0].name[:3]}'):
+                check(current, 'IngredientViewSet.list', 'get',
+                      f'/api/ingredients/{query}')
+            check(current, 'IngredientViewSet.retrieve', 'get',
+                  f'/api/ingredients/{ingredients[0].id}/')
+            for query in (
+                '', f'?author={author.id}', f'?tags={tag.slug}',
+                '?is_favorited=1', '?is_in_shopping_cart=1',
+                '?pagination=cursor', '?limit=50&page=2',
+                '?' + urlencode({'search': recipe.name.split()[0]})
+            ):
+                check(current, 'RecipeViewSet.list', 'get',
+                      f'/api/recipes/{query}')
+            check(current, 'RecipeViewSet.retrieve', 'get',
+                  f'/api/recipes/{recipe.id}/')
+            check(current, 'RecipeViewSet.get_short_link', 'get',
+                  f'/api/recipes/{recipe.id}/get-link/')
+            check(current, 'RecipeViewSet.similar', 'get',
+                  f'/api/recipes/{recipe.id}/similar/')
+            check(current, 'RecipeViewSet.cook', 'get',
+                  '/api/recipes/cook/?' + urlencode({
+                      'ingredients': [
+                          ingredient.id for ingredient in ingredients
+                      ],
+                      'tags': [tag.slug for tag in tags],
+                      'max_missing': 10,
+                  }, doseq=True))
+            check(current, 'FoodUserViewSet.list', 'get', '/api/users/')
+            check(current, 'FoodUserViewSet.retrieve', 'get',
+                  f'/api/users/{author.id}/')
+        check(anonymous, 'FoodUserViewSet.create', 'post', '/api/users/', {
+            'email': 'budget2@example.com', 'username': 'budget_user2',
+            'first_name': 'Второй', 'last_name': 'Пользователь',
+            'password': PASSWORD,
+        })
+        check(anonymous, 'TokenCreateView.post', 'post',
+              '/api/auth/token/login/',
+              {'email': 'budget2@example.com', 'password': PASSWORD})
+        for route, url, data in (
+            ('activation', 'activation', {'uid': 'x', 'token': 'x'}),
+            ('resend_activation', 'resend_activation',
+             {'email': 'nobody@example.com'}),
+            ('reset_password', 'reset_password',
+             {'email': 'nobody@example.com'}),
+            ('reset_password_confirm', 'reset_password_confirm',
+             {'uid': 'x', 'token': 'x', 'new_password': PASSWORD}),
+            ('reset_username', 'reset_email',
+             {'email': 'nobody@example.com'}),
+            ('reset_username_confirm', 'reset_email_confirm',
+             {'uid': 'x', 'token': 'x', 'new_email': 'x@example.com'}),
+        ):
+            check(anonymous, f'FoodUserViewSet.{route}', 'post',
+                  f'/api/users/{url}/', data)
+
+        check(client, 'FoodUserViewSet.me', 'get', '/api/users/me/')
+        check(client, 'FoodUserViewSet.me', 'patch', '/api/users/me/',
+              {'first_name': 'Изменено'})
+        check(client, 'FoodUserViewSet.update', 'put',
+              f'/api/users/{user.id}/', {
+                  'email': 'budget@example.com', 'username': 'budget_user',
+                  'first_name': 'Бюджет', 'last_name': 'Запросов',
+              })
+        check(client, 'FoodUserViewSet.partial_update', 'patch',
+              f'/api/users/{user.id}/', {'last_name': 'Изменено'})
+        check(client, 'FoodUserViewSet.set_password', 'post',
+              '/api/users/set_password/',
+              {'new_password': PASSWORD + '1', 'current_password': PASSWORD})
+        check(client, 'FoodUserViewSet.set_username', 'post',
+              '/api/users/set_email/', {
+                  'new_email': 'budget3@example.com',
+                  'current_password': PASSWORD + '1',
+              })
+        check(client, 'FoodUserViewSet.me_avatar', 'put',
+              '/api/users/me/avatar/', {'avatar': IMAGE})
+        user.refresh_from_db()
+        self.files.append(user.avatar.name)
+        check(client, 'FoodUserViewSet.delete_me_avatar', 'delete',
+              '/api/users/me/avatar/')
+        check(client, 'FoodUserViewSet.create_subscription', 'post',
+              f'/api/users/{author.id}/subscribe/')
+        check(client, 'FoodUserViewSet.subscriptions', 'get',
+              '/api/users/subscriptions/?recipes_limit=3')
+        check(client, 'FoodUserViewSet.delete_subscription', 'delete',
+              f'/api/users/{author.id}/subscribe/')
+
+        payload = {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for amount, ingredient in enumerate(ingredients, start=1)
+            ],
+            'tags': [tag.id for tag in tags],
+            'image': IMAGE,
+            'name': 'Проверка бюджета',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }
+        created = check(client, 'RecipeViewSet.create', 'post',
+                        '/api/recipes/', payload).json()['id']
+        self.files.append(Recipe.objects.get(id=created).image.name)
+        payload['ingredients'][0]['amount'] = 10
+        # PUT is validated by RecipeSerializer and answers 400.
+        check(client, 'RecipeViewSet.update', 'put',
+              f'/api/recipes/{created}/', payload)
+        check(client, 'RecipeViewSet.partial_update', 'patch',
+              f'/api/recipes/{created}/', {**payload, 'name': 'Изменено'})
+        self.files.append(Recipe.objects.get(id=created).image.name)
+        for action, route in (
+            ('favorite', 'favorite'), ('shopping_cart', 'shop')
+        ):
+            for current in (recipe.id, created):
+                check(client, f'RecipeViewSet.add_{route}', 'post',
+                      f'/api/recipes/{current}/{action}/')
+        check(client, 'RecipeViewSet.download_shopping_cart', 'get',
+              '/api/recipes/download_shopping_cart/')
+        for action, route in (
+            ('favorite', 'favorite'), ('shopping_cart', 'shop')
+        ):
+            check(client, f'RecipeViewSet.delete_{route}', 'delete',
+                  f'/api/recipes/{recipe.id}/{action}/')
+        check(client, 'RecipeViewSet.destroy', 'delete',
+              f'/api/recipes/{created}/')
+        bulk = {'recipes': list(Recipe.objects.order_by('-id').values_list(
+            'id', flat=True
+        )[:10]) + [recipe.id]}
+        for action, route in (
+            ('favorite', 'favorites'), ('shopping_cart', 'shops')
+        ):
+            check(client, f'RecipeViewSet.add_{route}', 'post',
+                  f'/api/recipes/{action}/', bulk)
+            check(client, f'RecipeViewSet.delete_{route}', 'delete',
+                  f'/api/recipes/{action}/', bulk)
+        check(client, 'RecipeViewSet.add_shops', 'post',
+              '/api/recipes/shopping_cart/', bulk)
+        check(client, 'RecipeViewSet.clear_shop', 'delete',
+              '/api/recipes/shopping_cart/clear/')
+
+        check(client, 'TokenDestroyView.post', 'post',
+              '/api/auth/token/logout/')
+        other = FoodUser.objects.get(email='budget2@example.com')
+        other_client = Client(
+            SERVER_NAME='localhost',
+            HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=other).key}'
+        )
+        check(other_client, 'FoodUserViewSet.destroy', 'delete',
+              f'/api/users/{other.id}/', {'current_password': PASSWORD})
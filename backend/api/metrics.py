@@ -0,0 +1,133 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from api.const import (
+    DURATION_BUCKETS,
+    METRICS_PREFIX,
+    QUERY_COUNT_BUCKETS,
+    RESPONSE_SIZE_BUCKETS
+)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class QueryTimer:
+    """connection.execute_wrapper counting queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class RequestTimings(QueryTimer):
+    """Timings of one request, collected by MetricsMiddleware."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view = 0.0
+        self.render = 0.0
+
+
+class Histogram:
+    """Prometheus histogram with one series per route label."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = f'{METRICS_PREFIX}_{name}'
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, route, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(route)
+            if series is None:
+                series = self.series[route] = [
+                    [0] * (len(self.buckets) + 1), 0.0
+                ]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = {
+                route: (list(counts), total)
+                for route, (counts, total) in self.series.items()
+            }
+        for route, (counts, total) in sorted(series.items()):
+            label = f'route="{route}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bound = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(
+                    f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return '\n'.join(lines)
+
+
+REQUEST_DURATION = Histogram(
+    'request_duration_seconds', 'Request duration.', DURATION_BUCKETS
+)
+VIEW_DURATION = Histogram(
+    'view_duration_seconds', 'View duration, serializers included.',
+    DURATION_BUCKETS
+)
+RENDER_DURATION = Histogram(
+    'render_duration_seconds', 'Response rendering duration.',
+    DURATION_BUCKETS
+)
+SQL_DURATION = Histogram(
+    'sql_duration_seconds', 'SQL time per request.', DURATION_BUCKETS
+)
+SQL_QUERIES = Histogram(
+    'sql_queries', 'SQL queries per request.', QUERY_COUNT_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'response_size_bytes', 'Response body size.', RESPONSE_SIZE_BUCKETS
+)
+HISTOGRAMS = (
+    REQUEST_DURATION,
+    VIEW_DURATION,
+    RENDER_DURATION,
+    SQL_DURATION,
+    SQL_QUERIES,
+    RESPONSE_SIZE,
+)
+
+
+def render_metrics():
+    """Return all histograms in Prometheus text format."""
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+def get_route(request):
+    """Return route label like RecipeViewSet.list for resolved request."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'cls', None)
+    if view is None:
+        return match.view_name or match._func_path
+    actions = getattr(match.func, 'actions', None) or {}
+    method = request.method.lower()
+    return f'{view.__name__}.{actions.get(method, method)}'
@@ -0,0 +1,103 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from api.budget import SQLShapeCounter, report_problems
+from api.const import QUERY_BUDGETS
+from api.metrics import (
+    RENDER_DURATION,
+    REQUEST_DURATION,
+    RESPONSE_SIZE,
+    SQL_DURATION,
+    SQL_QUERIES,
+    VIEW_DURATION,
+    RequestTimings,
+    current_timings,
+    get_route
+)
+
+
+def count_streaming(content, route):
+    size = 0
+    for chunk in content:
+        size += len(chunk)
+        yield chunk
+    RESPONSE_SIZE.observe(route, size)
+
+
+class MetricsMiddleware:
+    """Collect per-route timings and send them in Server-Timing header.
+
+    Only counters and perf_counter() calls are added to a request, so the
+    middleware stays on in production. Histograms are kept per process.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with connection.execute_wrapper(timings):
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        if timings.view_started is not None and not timings.view:
+            timings.view = time.perf_counter() - timings.view_started
+        total = time.perf_counter() - timings.started
+        route = get_route(request)
+        REQUEST_DURATION.observe(route, total)
+        VIEW_DURATION.observe(route, timings.view)
+        RENDER_DURATION.observe(route, timings.render)
+        SQL_DURATION.observe(route, timings.duration)
+        SQL_QUERIES.observe(route, timings.count)
+        if response.streaming:
+            response.streaming_content = count_streaming(
+                response.streaming_content, route
+            )
+        else:
+            RESPONSE_SIZE.observe(route, len(response.content))
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timings.duration * 1000:.2f};'
+            f'desc="{timings.count} queries"',
+            f'view;dur={timings.view * 1000:.2f}',
+            f'render;dur={timings.render * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_timings.get().view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Called after the view, before DRF Response is rendered.
+        timings = current_timings.get()
+        if timings.view_started is not None:
+            timings.view = time.perf_counter() - timings.view_started
+        return response
+
+
+class QueryBudgetMiddleware:
+    """Check requests against QUERY_BUDGETS and repeated SQL shapes.
+
+    Installed when QUERY_BUDGET_MODE is warn or raise, e.g. on CI and in
+    local development.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.strict = settings.QUERY_BUDGET_MODE == 'raise'
+
+    def __call__(self, request):
+        counter = SQLShapeCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        route = get_route(request)
+        report_problems(
+            counter.get_problems(QUERY_BUDGETS.get(route)),
+            route,
+            self.strict
+        )
+        return response
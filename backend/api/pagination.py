@@ -1,6 +1,16 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from datetime import datetime
 
-from api.const import RECIPES_LIMIT
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor,
+    CursorPagination,
+    PageNumberPagination
+)
+
+from api.const import CURSOR_PAGINATION, PAGINATION_PARAM, RECIPES_LIMIT
 
 
 class UsersRecipesPagination(PageNumberPagination):
@@ -8,3 +18,163 @@ class UsersRecipesPagination(PageNumberPagination):
 
     page_size = RECIPES_LIMIT
     page_size_query_param = 'limit'
+
+
+class KeysetCursorPagination(CursorPagination):
+    """Cursor pagination seeking by every ordering field.
+
+    DRF CursorPagination stores only the first ordering field in cursor,
+    rows sharing its value are paged by offset. Here cursor stores values
+    of all ordering fields of the edge row and the page is filtered by
+    tuple comparison, for ('-created_at', '-id') it is
+    created_at < c OR (created_at = c AND id < i).
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None if self.cursor is None else self.cursor.position
+        queryset = queryset.order_by(*(
+            self.get_reversed_ordering() if reverse else self.ordering
+        ))
+        if position is not None:
+            queryset = queryset.filter(self.get_seek_filter(
+                self.decode_position(position, queryset.model), reverse
+            ))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=False,
+            position=(
+                self.get_position(self.page[-1]) if self.page
+                else self.cursor.position
+            )
+        ))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0,
+            reverse=True,
+            position=(
+                self.get_position(self.page[0]) if self.page
+                else self.cursor.position
+            )
+        ))
+
+    def get_reversed_ordering(self):
+        return tuple(
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        )
+
+    def get_seek_filter(self, values, reverse):
+        """Return filter of rows following values in page direction."""
+        seek = equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            seek |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return seek
+
+    def get_position(self, instance):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = (
+                instance[name] if isinstance(instance, dict)
+                else getattr(instance, name)
+            )
+            # Keep microseconds, feed timestamps may differ only in them.
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return json.dumps(values)
+
+    def decode_position(self, position, model):
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or (
+                len(values) != len(self.ordering)
+            ):
+                raise ValueError
+            return [
+                self.to_python(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def to_python(model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotation, e.g. subscription_id.
+            if not isinstance(value, int):
+                raise ValueError
+            return value
+        return field.to_python(value)
+
+
+class RecipesCursorPagination(KeysetCursorPagination):
+    """Keyset pagination for recipes feed, newest first."""
+
+    page_size = RECIPES_LIMIT
+    page_size_query_param = 'limit'
+    ordering = ('-created_at', '-id')
+
+
+class SubscriptionsCursorPagination(RecipesCursorPagination):
+    """Keyset pagination for subscriptions, latest subscription first."""
+
+    ordering = ('-subscription_id',)
+
+
+class CursorPaginationMixin:
+    """Switch view to cursor pagination by ?pagination=cursor.
+
+    cursor_pagination_classes maps view action to cursor pagination class,
+    other actions and requests keep pagination_class.
+    """
+
+    cursor_pagination_classes = {}
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_pagination_class = self.cursor_pagination_classes.get(
+                self.action
+            )
+            if (
+                cursor_pagination_class is not None
+                and self.request.query_params.get(PAGINATION_PARAM)
+                == CURSOR_PAGINATION
+            ):
+                self._paginator = cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
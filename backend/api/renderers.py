@@ -0,0 +1,92 @@
+import abc
+import csv
+import json
+import time
+
+from rest_framework import renderers
+
+from api.const import SHOP_LIST_HEADER
+from api.metrics import current_timings
+
+
+class TimedJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer adding its time to MetricsMiddleware timings."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        timings = current_timings.get()
+        start = time.perf_counter()
+        try:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        finally:
+            if timings is not None:
+                timings.render += time.perf_counter() - start
+
+
+class Echo:
+    """File-like object returning written value, used by csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+class ShopListRenderer(renderers.BaseRenderer, metaclass=abc.ABCMeta):
+    """Base renderer for streaming shopping list download.
+
+    stream() yields chunks for StreamingHttpResponse one ingredient at a
+    time, so memory does not depend on cart size. Error responses of the
+    download view are rendered by TimedJSONRenderer instead.
+    """
+
+    charset = 'utf-8'
+
+    @abc.abstractmethod
+    def stream(self, shop_ingredients):
+        """Yield shopping list chunks as str."""
+
+
+class ShopListTextRenderer(ShopListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, shop_ingredients):
+        yield ', '.join(SHOP_LIST_HEADER)
+        for item in shop_ingredients:
+            yield (f'\n{item["ingredient__name"]}'
+                   f', {item["ingredient__measurement_unit"]}'
+                   f', {item["amount"]}')
+
+
+class ShopListCSVRenderer(ShopListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, shop_ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(SHOP_LIST_HEADER)
+        for item in shop_ingredients:
+            yield writer.writerow((
+                item['ingredient__name'],
+                item['ingredient__measurement_unit'],
+                item['amount']
+            ))
+
+
+class ShopListJSONRenderer(ShopListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, shop_ingredients):
+        separator = '['
+        for item in shop_ingredients:
+            yield separator + json.dumps(
+                {
+                    'name': item['ingredient__name'],
+                    'measurement_unit': item['ingredient__measurement_unit'],
+                    'amount': item['amount'],
+                },
+                ensure_ascii=False
+            )
+            separator = ','
+        yield '[]' if separator == '[' else ']'
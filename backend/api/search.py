@@ -0,0 +1,125 @@
+import re
+from bisect import bisect_left
+from itertools import islice
+
+from django.db import connection
+
+from api.cache import get_catalog_version
+from api.const import INGREDIENT_SEARCH_LIMIT, INGREDIENT_SUBSTRING_MIN_LENGTH
+from recipes.fulltext import SEARCH_CONFIG, SEARCH_TABLE
+from recipes.models import Ingredient
+
+WORD = re.compile(r'\w+')
+
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+
+
+class IngredientIndex:
+    """Case folded, sorted ingredient names searched by bisect."""
+
+    def __init__(self, ingredients):
+        rows = sorted(
+            (ingredient['name'].casefold(), ingredient)
+            for ingredient in ingredients
+        )
+        self.keys = [key for key, ingredient in rows]
+        self.ingredients = [ingredient for key, ingredient in rows]
+
+    def search(self, name, limit=INGREDIENT_SEARCH_LIMIT):
+        """Return exact and prefix matches first, then substring ones."""
+        name = name.casefold()
+        start = bisect_left(self.keys, name)
+        end = bisect_left(self.keys, name + chr(0x10FFFF), lo=start)
+        found = self.ingredients[start:min(end, start + limit)]
+        if len(found) < limit and (
+            len(name) >= INGREDIENT_SUBSTRING_MIN_LENGTH
+        ):
+            found += islice(
+                (
+                    ingredient
+                    for key, ingredient in zip(self.keys, self.ingredients)
+                    if name in key and not key.startswith(name)
+                ),
+                limit - len(found)
+            )
+        return found
+
+
+_index = (None, None)
+
+
+def get_ingredient_index(version=None):
+    """Return in-memory index, rebuilt when ingredient catalog changes."""
+    global _index
+    if version is None:
+        version = get_catalog_version('ingredient')
+    if _index[0] != version:
+        _index = (version, IngredientIndex(
+            Ingredient.objects.values(*INGREDIENT_FIELDS).iterator()
+        ))
+    return _index[1]
+
+
+def search_ingredients(name, limit=INGREDIENT_SEARCH_LIMIT, version=None):
+    """Return ingredients for autocomplete, capped by limit.
+
+    PostgreSQL serves prefix part from UPPER(name) text_pattern_ops
+    index and substring part from UPPER(name) pg_trgm GIN index, other
+    databases use in-memory index of catalog version. Names shorter than
+    INGREDIENT_SUBSTRING_MIN_LENGTH get prefix matches only.
+    """
+    if connection.vendor != 'postgresql':
+        return get_ingredient_index(version).search(name, limit)
+    ingredients = Ingredient.objects.values(*INGREDIENT_FIELDS)
+    found = list(
+        ingredients.filter(name__istartswith=name).order_by('name')[:limit]
+    )
+    if len(found) < limit and len(name) >= INGREDIENT_SUBSTRING_MIN_LENGTH:
+        found += ingredients.filter(
+            name__icontains=name
+        ).exclude(
+            name__istartswith=name
+        ).order_by('name')[:limit - len(found)]
+    return found
+
+
+def get_fts5_query(query):
+    """Return FTS5 MATCH query: all words as quoted prefixes.
+
+    FTS5 has no Russian stemmer, prefixes find other word forms.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def search_recipes(queryset, query):
+    """Filter recipes by full-text query, most relevant first.
+
+    Name is weighted above text. PostgreSQL reads GIN index over
+    search_vector, SQLite joins FTS5 table, see recipes.fulltext.
+    """
+    if connection.vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        tables = ()
+        where = f'recipes_recipe.search_vector @@ {tsquery}'
+        rank = f'ts_rank(recipes_recipe.search_vector, {tsquery})'
+        rank_params = (query,)
+    else:
+        query = get_fts5_query(query)
+        if not query:
+            return queryset.none()
+        # bm25() is only valid in the query matching FTS5 table, so the
+        # table is joined instead of filtered by subquery.
+        tables = (SEARCH_TABLE,)
+        where = (
+            f'{SEARCH_TABLE}.rowid = recipes_recipe.id '
+            f'AND {SEARCH_TABLE} MATCH %s'
+        )
+        rank = f'-bm25({SEARCH_TABLE}, 2.5, 1.0)'
+        rank_params = ()
+    return queryset.extra(
+        tables=tables,
+        where=(where,),
+        params=(query,),
+        select={'search_rank': rank},
+        select_params=rank_params,
+    ).order_by('-search_rank', '-id')
@@ -1,23 +1,71 @@
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
-from api.const import MAX_VALUE, MIN_VALUE
+from api.const import (
+    BULK_RECIPES_LIMIT,
+    COOK_INGREDIENTS_LIMIT,
+    MAX_ID,
+    MAX_VALUE,
+    MIN_VALUE
+)
+from api.fields import (
+    BulkPrimaryKeyRelatedField,
+    BulkRelatedListSerializer,
+    PrimaryKeyListField
+)
 from recipes.models import (
-    UserRecipeBaseModel,
-    Favorite,
     Ingredient,
     Recipe,
     RecipeIngredientsAmount,
-    Shop,
+    ShopIngredient,
     Tag
 )
-from users.models import (
-    Subscription,
-)
 
 User = get_user_model()
+
+
+def get_subscribed_ids(request):
+    """Return ids of authors followed by request user.
+
+    The ids are fetched with one query and cached on the request, so
+    is_subscribed costs nothing per serialized user.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, 'subscribed_ids'):
+        request.subscribed_ids = frozenset(
+            request.user.user_subscriptions.values_list(
+                'author_id', flat=True
+            )
+        )
+    return request.subscribed_ids
+
+
+def get_recipes_limit(request):
+    """Return recipes_limit query param as int or None."""
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
+
+def get_recipe_prefetch():
+    """Return prefetch lookups needed by RecipeSerializer."""
+    return (
+        'tags',
+        Prefetch(
+            'ingredient_amount',
+            queryset=RecipeIngredientsAmount.objects.select_related(
+                'ingredient'
+            )
+        ),
+    )
+
 # =============================Users=======================================
 
 
@@ -36,23 +84,18 @@ class UserListRetrieveSerializer(UserSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
 
-    class Meta(UserSerializer):
+    class Meta(UserSerializer.Meta):
         model = User
         fields = UserSerializer.Meta.fields + ('is_subscribed', 'avatar')
 
     def get_is_subscribed(self, obj):
-        request = self.context['request']
-        return (request and request.user
-                and obj.author_subscriptions.filter(
-                    user=request.user.id
-                ).exists())
+        return obj.id in get_subscribed_ids(self.context.get('request'))
 
 
 class SubscriptionSerializer(UserListRetrieveSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(default=0)
 
-    class Meta(UserListRetrieveSerializer):
+    class Meta(UserListRetrieveSerializer.Meta):
         model = User
         fields = UserListRetrieveSerializer.Meta.fields + (
             'recipes',
@@ -60,13 +103,13 @@ class SubscriptionSerializer(UserListRetrieveSerializer):
         )
 
     def get_recipes(self, obj):
-        request = self.context['request']
-        recipes_limit = request.POST.get('recipes_limit', 'привет')
-        try:
-            recipes_limit = int(recipes_limit)
-        except ValueError:
-            recipes_limit = None
-        recipes_list = obj.recipes.all()[:recipes_limit]
+        recipes_preview = self.context.get('recipes_preview')
+        if recipes_preview is not None:
+            recipes_list = recipes_preview.get(obj.id, ())
+        else:
+            recipes_list = obj.recipes.all()[
+                :get_recipes_limit(self.context['request'])
+            ]
         return FavoriteShopSubscriptSerializer(
             recipes_list,
             context=self.context,
@@ -74,32 +117,6 @@ class SubscriptionSerializer(UserListRetrieveSerializer):
         ).data
 
 
-class SubscriptionCreateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Subscription
-        fields = ('user', 'author')
-
-    def validate(self, data):
-        user = data['user']
-        author = data['author']
-        if user.id == author.id:
-            raise serializers.ValidationError(
-                {'subscription error': 'Нельзя подписаться на себя.'}
-            )
-        if Subscription.objects.filter(
-            user=user, author=author
-        ).exists():
-            raise serializers.ValidationError(
-                {'subscription error': 'Подписка уже есть.'}
-            )
-        return data
-
-    def to_representation(self, instance):
-        return SubscriptionSerializer(
-            instance.author,
-            context=self.context
-        ).data
-
 # ======================Recipes=======================================
 
 
@@ -154,7 +171,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 
 class IdAmountSerializer(serializers.Serializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
     )
     amount = serializers.IntegerField(
@@ -162,12 +179,13 @@ class IdAmountSerializer(serializers.Serializer):
         max_value=MAX_VALUE
     )
 
+    class Meta:
+        list_serializer_class = BulkRelatedListSerializer
+
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = IdAmountSerializer(many=True)
-    tags = serializers.ListField(child=serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all()
-    ))
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     image = Base64ImageField(allow_null=True, allow_empty_file=True)
     cooking_time = serializers.IntegerField(min_value=MIN_VALUE,
                                             max_value=MAX_VALUE)
@@ -188,33 +206,88 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         objs = [
             RecipeIngredientsAmount(
                 recipe=recipe,
-                ingredient_id=item['id'].id,
+                ingredient=item['id'],
                 amount=item['amount']
             )
             for item in ingredients
         ]
         RecipeIngredientsAmount.objects.bulk_create(objs)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         author = self.context['request'].user
         recipe = Recipe.objects.create(**validated_data, author=author)
-        recipe.save()
         self.create_new_ingredients(ingredients, recipe)
         recipe.tags.set(tags)
         return recipe
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        """Write only inserted, changed and removed ingredient amounts."""
+        amounts = {item['id'].id: item['amount'] for item in ingredients}
+        current = {
+            amount.ingredient_id: amount
+            for amount in RecipeIngredientsAmount.objects.filter(
+                recipe=recipe
+            )
+        }
+        changed = []
+        for ingredient_id, amount in current.items():
+            if ingredient_id in amounts and (
+                amount.amount != amounts[ingredient_id]
+            ):
+                amount.amount = amounts[ingredient_id]
+                changed.append(amount)
+        removed = [
+            amount.id for ingredient_id, amount in current.items()
+            if ingredient_id not in amounts
+        ]
+        new = [
+            RecipeIngredientsAmount(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if not (changed or removed or new):
+            return
+        ShopIngredient.remove_recipes(recipe_id=recipe.id)
+        if removed:
+            RecipeIngredientsAmount.delete_quietly(recipe.id, removed)
+        if changed:
+            RecipeIngredientsAmount.objects.bulk_update(changed, ('amount',))
+        if new:
+            RecipeIngredientsAmount.objects.bulk_create(new)
+        ShopIngredient.add_recipes(recipe_id=recipe.id)
+
+    @staticmethod
+    def update_tags(tags, recipe):
+        current = set(Recipe.tags.through.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        new = {tag.id for tag in tags}
+        if current - new:
+            recipe.tags.remove(*(current - new))
+        if new - current:
+            recipe.tags.add(*(new - current))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.remove()
-        instance.ingredient_amount.all().delete()
-        self.create_new_ingredients(ingredients, instance)
-        instance.tags.set(tags)
+        # Concurrent updates of the recipe wait for the lock, and the diff
+        # is computed from committed rows, not from prefetched ones.
+        list(Recipe.objects.select_for_update().filter(
+            pk=instance.pk
+        ).values_list('pk'))
+        self.update_ingredients(validated_data.pop('ingredients'), instance)
+        self.update_tags(validated_data.pop('tags'), instance)
         return super().update(instance=instance, validated_data=validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], *get_recipe_prefetch())
         return RecipeSerializer(
             instance=instance,
             context=self.context
@@ -265,47 +338,26 @@ class FavoriteShopSubscriptSerializer(serializers.ModelSerializer):
         )
 
 
-class FavoriteShopCreateSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = UserRecipeBaseModel
-        fields = (
-            'user',
-            'recipe',
-        )
-        abstract = True
-
-    def validate(self, data):
-        model = self.Meta.model
-        if model.objects.filter(
-                user=data['user'],
-                recipe=data['recipe']
-        ).exists():
-            raise serializers.ValidationError(
-                {f'{model._meta.verbose_name} error': 'Был добавлен ранее.'}
-            )
-        return data
-
-    def to_representation(self, instance):
-        recipe = instance.recipe
-        return FavoriteShopSubscriptSerializer(
-            recipe,
-            context=self.context
-        ).data
-
-
-class FavoriteCreateSerializer(FavoriteShopCreateSerializer):
-    class Meta:
-        model = Favorite
-        fields = (
-            'user',
-            'recipe',
-        )
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(
+            min_value=MIN_VALUE, max_value=MAX_ID
+        ),
+        allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT
+    )
 
 
-class ShopCreateSerializer(FavoriteShopCreateSerializer):
-    class Meta:
-        model = Shop
-        fields = (
-            'user',
-            'recipe',
-        )
+class CookQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(
+            min_value=MIN_VALUE, max_value=MAX_ID
+        ),
+        allow_empty=False,
+        max_length=COOK_INGREDIENTS_LIMIT
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+    tags = serializers.ListField(
+        child=serializers.SlugField(),
+        required=False
+    )
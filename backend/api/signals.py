@@ -0,0 +1,70 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (
+    bump_catalog_version,
+    bump_recipe_card_version,
+    invalidate_recipe_cards
+)
+from api.cook import record_recipe_change
+from recipes.models import Ingredient, Recipe, RecipeIngredientsAmount, Tag
+from users.models import FoodUser
+
+
+def invalidate_recipes(recipe_ids):
+    """Drop cached cards and log changes once transaction commits.
+
+    Done earlier, a concurrent request could cache a card read before
+    commit, which would stay stale for RECIPE_CARD_TIMEOUT. Recipe
+    ingredients are written by bulk_create and bulk_update after Recipe
+    is saved, so cook index reads them after commit as well.
+    """
+    recipe_ids = tuple(recipe_ids)
+    transaction.on_commit(partial(invalidate_recipe_cards, recipe_ids))
+    for recipe_id in recipe_ids:
+        transaction.on_commit(partial(record_recipe_change, recipe_id))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    invalidate_recipes((instance.id,))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredientsAmount)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    invalidate_recipes((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes((instance.id,))
+    elif pk_set:
+        invalidate_recipes(pk_set)
+    else:
+        transaction.on_commit(bump_recipe_card_version)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(
+        partial(bump_catalog_version, sender._meta.model_name)
+    )
+    transaction.on_commit(bump_recipe_card_version)
+
+
+@receiver(post_save, sender=FoodUser)
+def invalidate_author(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(partial(
+        invalidate_recipe_cards,
+        tuple(instance.recipes.values_list('id', flat=True))
+    ))
@@ -0,0 +1,572 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.budget import query_budget
+from api.cache import bump_catalog_version, bump_recipe_card_version
+from api.const import (
+    BULK_ADDED,
+    BULK_ALREADY_ADDED,
+    BULK_NOT_ADDED,
+    BULK_NOT_FOUND,
+    BULK_REMOVED,
+    QUERY_BUDGETS
+)
+from api.search import search_ingredients
+from api.serializers import RecipeCreateSerializer, get_recipe_prefetch
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredientsAmount,
+    Shop,
+    ShopIngredient,
+    Tag
+)
+from users.models import FoodUser, Subscription
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PASSWORD = 'test-Passw0rd'
+
+
+def create_user(number):
+    return FoodUser.objects.create_user(
+        email=f'user{number}@example.com', username=f'user{number}',
+        first_name='Имя', last_name='Фамилия', password=PASSWORD
+    )
+
+
+def create_recipe(author, ingredients, tags, number=0):
+    recipe = Recipe.objects.create(
+        author=author, name=f'Рецепт {number}', text='Описание',
+        cooking_time=10, image='recipes/images/test.png'
+    )
+    RecipeIngredientsAmount.objects.bulk_create(
+        RecipeIngredientsAmount(
+            recipe=recipe, ingredient=ingredient, amount=amount
+        )
+        for amount, ingredient in enumerate(ingredients, start=1)
+    )
+    recipe.tags.set(tags)
+    return recipe
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class APITestCase(TestCase):
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [create_user(number) for number in range(3)]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(6)
+        ]
+        cls.recipes = [
+            create_recipe(
+                cls.authors[number % len(cls.authors)],
+                cls.ingredients[number % 3:number % 3 + 3],
+                cls.tags[:number % 2 + 1],
+                number
+            )
+            for number in range(12)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def login(self, user):
+        self.client.force_authenticate(user)
+
+
+class QueryBudgetTests(APITestCase):
+
+    def test_every_route_within_budget(self):
+        stdout = StringIO()
+        call_command('check_query_budgets', stdout=stdout)
+        self.assertIn('Проверено маршрутов', stdout.getvalue())
+
+    def test_read_routes_within_budget(self):
+        recipe = self.recipes[0]
+        for route, url in (
+            ('RecipeViewSet.list', '/api/recipes/'),
+            ('RecipeViewSet.retrieve', f'/api/recipes/{recipe.id}/'),
+            ('FoodUserViewSet.list', '/api/users/'),
+            ('TagViewSet.list', '/api/tags/'),
+            ('IngredientViewSet.list', '/api/ingredients/'),
+        ):
+            with self.subTest(route=route), query_budget(
+                QUERY_BUDGETS[route], label=route
+            ):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ShopIngredientTests(APITestCase):
+
+    def setUp(self):
+        self.user = create_user('buyer')
+        self.login(self.user)
+
+    def assertShopListInSync(self):
+        self.assertCountEqual(
+            ShopIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ),
+            ShopIngredient.get_live_totals()
+        )
+
+    def test_author_deleted_with_recipes_in_cart(self):
+        author = self.authors[0]
+        for recipe in self.recipes[:4]:
+            self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertShopListInSync()
+        self.login(author)
+        response = self.client.delete(
+            '/api/users/me/', {'current_password': PASSWORD}, format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            Shop.objects.filter(recipe__author=author).exists()
+        )
+        self.assertShopListInSync()
+        self.login(self.user)
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_deleted_with_api(self):
+        recipe = self.recipes[1]
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.login(recipe.author)
+        response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShopIngredient.objects.exists())
+
+    def test_recipe_updated_with_api(self):
+        recipe = self.recipes[1]
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.login(recipe.author)
+        response = self.client.patch(f'/api/recipes/{recipe.id}/', {
+            'ingredients': [
+                {'id': self.ingredients[1].id, 'amount': 50},
+                {'id': self.ingredients[5].id, 'amount': 3},
+            ],
+            'tags': [self.tags[0].id],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertShopListInSync()
+
+    def test_shop_rows_changed_with_orm(self):
+        shop = Shop.objects.create(user=self.user, recipe=self.recipes[0])
+        Shop.objects.create(user=self.user, recipe=self.recipes[1])
+        self.assertShopListInSync()
+        shop.recipe = self.recipes[2]
+        shop.save()
+        self.assertShopListInSync()
+        shop.delete()
+        self.assertShopListInSync()
+        amount = RecipeIngredientsAmount.objects.filter(
+            recipe=self.recipes[1]
+        ).first()
+        amount.amount = 100
+        amount.save()
+        self.assertShopListInSync()
+        amount.ingredient = self.ingredients[5]
+        amount.save()
+        self.assertShopListInSync()
+        RecipeIngredientsAmount.objects.create(
+            recipe=self.recipes[1], ingredient=self.ingredients[4], amount=7
+        )
+        self.assertShopListInSync()
+        amount.delete()
+        self.assertShopListInSync()
+        Recipe.objects.filter(id=self.recipes[1].id).delete()
+        self.assertShopListInSync()
+        self.assertFalse(ShopIngredient.objects.exists())
+
+
+class ShopListDownloadTests(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    def test_download(self):
+        self.login(self.authors[0])
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/shopping_cart/')
+        for fmt, content_type in (
+            ('txt', 'text/plain'),
+            ('csv', 'text/csv'),
+            ('json', 'application/json'),
+        ):
+            with self.subTest(format=fmt):
+                response = self.client.get(self.url, {'format': fmt})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response['Content-Type'], f'{content_type}; charset=utf-8'
+                )
+                self.assertIn(
+                    'Ингредиент 0',
+                    b''.join(response.streaming_content).decode()
+                )
+
+    def test_errors_rendered_as_json(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+        self.login(self.authors[0])
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+
+
+class BulkRecipesTests(APITestCase):
+
+    def setUp(self):
+        self.login(self.authors[0])
+
+    def request(self, method, url, recipe_ids):
+        response = getattr(self.client, method)(
+            url, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (result['id'], result['status'])
+            for result in response.json()['results']
+        ]
+
+    def test_statuses_per_id(self):
+        first, second = self.recipes[0].id, self.recipes[1].id
+        missing = 10 ** 6
+        for url in ('/api/recipes/favorite/', '/api/recipes/shopping_cart/'):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.request('post', url, [first, missing, first]),
+                    [(first, BULK_ADDED), (missing, BULK_NOT_FOUND)]
+                )
+                self.assertEqual(
+                    self.request('post', url, [first, second]),
+                    [(first, BULK_ALREADY_ADDED), (second, BULK_ADDED)]
+                )
+                self.assertEqual(
+                    self.request('delete', url, [second, missing]),
+                    [(second, BULK_REMOVED), (missing, BULK_NOT_FOUND)]
+                )
+                self.assertEqual(
+                    self.request('delete', url, [first, second]),
+                    [(first, BULK_REMOVED), (second, BULK_NOT_ADDED)]
+                )
+
+    def test_ids_out_of_range(self):
+        for method, url, data in (
+            ('post', '/api/recipes/favorite/', {'recipes': [2 ** 63]}),
+            ('delete', '/api/recipes/shopping_cart/', {'recipes': [2 ** 63]}),
+            ('get', '/api/recipes/cook/', {'ingredients': [2 ** 63]}),
+        ):
+            with self.subTest(method=method, url=url):
+                response = getattr(self.client, method)(
+                    url, data, format=None if method == 'get' else 'json'
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+class CatalogVersionTests(APITestCase):
+
+    def test_version_shared_between_processes(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        # Cache of another process is empty, version is the same.
+        cache.clear()
+        self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
+        # Bump made by a management command in its own process.
+        bump_catalog_version('tag')
+        cache.clear()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class IngredientSearchTests(APITestCase):
+
+    def search(self, name, **params):
+        response = self.client.get(
+            '/api/ingredients/', {'name': name, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_matches_before_substring_ones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ('морская соль', 'соль', 'сольный сыр', 'фасоль'):
+                Ingredient.objects.create(name=name, measurement_unit='г')
+        self.assertEqual(
+            self.search('Соль'),
+            ['соль', 'сольный сыр', 'морская соль', 'фасоль']
+        )
+        # Short names get prefix matches only.
+        self.assertEqual(self.search('со'), ['соль', 'сольный сыр'])
+
+    def test_limit(self):
+        self.assertEqual(
+            search_ingredients('ингредиент', limit=4),
+            [
+                {'id': ingredient.id, 'name': ingredient.name,
+                 'measurement_unit': ingredient.measurement_unit}
+                for ingredient in self.ingredients[:4]
+            ]
+        )
+        self.assertEqual(len(self.search('ингредиент')), 6)
+        self.assertEqual(search_ingredients('едиент 5', limit=1), [{
+            'id': self.ingredients[5].id, 'name': 'Ингредиент 5',
+            'measurement_unit': 'г'
+        }])
+
+
+class CookTests(APITestCase):
+
+    def test_recipe_with_tags_only(self):
+        recipe = create_recipe(self.authors[0], (), self.tags, 99)
+        # Changes are logged on commit, which never comes in TestCase.
+        bump_recipe_card_version()
+        response = self.client.get('/api/recipes/cook/', {
+            'ingredients': [self.ingredients[0].id],
+            'tags': [tag.slug for tag in self.tags],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(
+            recipe.id, [found['id'] for found in response.json()['results']]
+        )
+
+
+class RecipeCardTests(APITestCase):
+
+    def get_names(self):
+        return {
+            recipe['id']: recipe['name']
+            for recipe in self.client.get(
+                '/api/recipes/', {'limit': 100}
+            ).json()['results']
+        }
+
+    def test_cards_invalidated_on_commit(self):
+        recipe = self.recipes[0]
+        self.assertEqual(self.get_names()[recipe.id], recipe.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            changed = Recipe.objects.get(id=recipe.id)
+            changed.name = 'Изменено'
+            changed.save()
+            # Card cached before commit is dropped when it comes.
+            self.assertEqual(self.get_names()[recipe.id], recipe.name)
+        self.assertEqual(self.get_names()[recipe.id], 'Изменено')
+
+
+class RecipeListQueriesTests(APITestCase):
+
+    def assertListQueries(self, queries):
+        for limit in (1, 5, 12):
+            for cached in (False, True):
+                if not cached:
+                    bump_recipe_card_version()
+                with self.subTest(limit=limit, cached=cached), \
+                        self.assertNumQueries(queries[cached]):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit}
+                    )
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous(self):
+        self.assertListQueries({False: 5, True: 2})
+
+    def test_authenticated(self):
+        self.login(self.authors[0])
+        self.assertListQueries({False: 8, True: 5})
+
+
+class CursorPaginationTests(APITestCase):
+
+    def get_pages(self, url, params, link='next'):
+        """Return ids of every page following url."""
+        pages = []
+        while url:
+            response = self.client.get(url, params).json()
+            pages.append([item['id'] for item in response['results']])
+            url, params = response[link], None
+        return pages
+
+    def test_rows_with_equal_created_at(self):
+        Recipe.objects.update(created_at=Recipe.objects.first().created_at)
+        expected = sorted((recipe.id for recipe in self.recipes), reverse=True)
+        pages = self.get_pages(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5}
+        )
+        self.assertEqual(pages, [expected[:5], expected[5:10], expected[10:]])
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 5}
+        ).json()
+        response = self.client.get(response['next']).json()
+        # Recipe added on top does not shift following pages.
+        added = create_recipe(
+            self.authors[0], self.ingredients[:1], self.tags, 99
+        )
+        bump_recipe_card_version()
+        self.assertEqual(
+            self.get_pages(response['next'], None), [expected[10:]]
+        )
+        self.assertEqual(
+            self.get_pages(response['previous'], None, 'previous'),
+            [expected[:5], [added.id]]
+        )
+
+    def test_subscriptions(self):
+        user = create_user('reader')
+        for author in self.authors:
+            Subscription.add(user.id, author.id)
+        self.login(user)
+        self.assertEqual(
+            self.get_pages('/api/users/subscriptions/', {
+                'pagination': 'cursor', 'limit': 2
+            }),
+            [
+                [self.authors[2].id, self.authors[1].id],
+                [self.authors[0].id]
+            ]
+        )
+
+    def test_invalid_cursor(self):
+        for cursor in ('cD0xMA==', 'cD0lNUIlMjJ4JTIyJTJDMSU1RA=='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/recipes/', {
+                    'pagination': 'cursor', 'cursor': cursor
+                })
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipeUpdateTests(APITestCase):
+
+    def test_update_of_stale_instance(self):
+        recipe = self.recipes[0]
+        stale = Recipe.objects.prefetch_related(
+            *get_recipe_prefetch()
+        ).get(id=recipe.id)
+        added = self.ingredients[5]
+        # Concurrent update committed after stale instance was read.
+        RecipeIngredientsAmount.objects.create(
+            recipe=recipe, ingredient=added, amount=1
+        )
+        recipe.tags.add(self.tags[1])
+        serializer = RecipeCreateSerializer(stale, data={
+            'ingredients': [{'id': added.id, 'amount': 7}],
+            'tags': [self.tags[1].id],
+        }, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(
+            list(recipe.ingredient_amount.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(added.id, 7)]
+        )
+        self.assertEqual(
+            list(recipe.tags.values_list('id', flat=True)),
+            [self.tags[1].id]
+        )
+
+
+class CounterTests(APITestCase):
+
+    def test_recipe_update_keeps_counters(self):
+        recipe = self.recipes[0]
+        stale = Recipe.objects.get(id=recipe.id)
+        Favorite.add(self.authors[1].id, recipe.id)
+        Shop.add(self.authors[1].id, recipe.id)
+        serializer = RecipeCreateSerializer(stale, data={
+            'name': 'Изменено',
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+            'tags': [self.tags[0].id],
+        }, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Изменено')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+
+    def test_profile_update_keeps_counters(self):
+        author = self.authors[0]
+        stale = FoodUser.objects.get(id=author.id)
+        Subscription.add(self.authors[1].id, author.id)
+        self.login(stale)
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Другое'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, 204)
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Другое')
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 4)
+
+
+class BenchmarkTests(APITestCase):
+
+    def test_writes_rolled_back(self):
+        user = create_user('buyer')
+        recipe = self.recipes[0]
+        Favorite.objects.create(user=user, recipe=recipe)
+        Shop.objects.create(user=user, recipe=recipe)
+        output = os.path.join(MEDIA_ROOT, 'benchmark.json')
+        call_command(
+            'benchmark_api', only='add', repeat=2, warmup=0, output=output,
+            stdout=StringIO()
+        )
+        self.assertTrue(
+            Favorite.objects.filter(user=user, recipe=recipe).exists()
+        )
+        self.assertTrue(
+            Shop.objects.filter(user=user, recipe=recipe).exists()
+        )
+        self.assertFalse(user.user_subscriptions.exists())
+        self.assertFalse(Token.objects.exists())
+
+
+class MetricsTests(APITestCase):
+
+    def test_metrics_closed_without_token(self):
+        with override_settings(METRICS_TOKEN='', DEBUG=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.client.get('/api/tags/')
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'foodgram_render_duration_seconds_count{route="TagViewSet.list"}',
+            response.content.decode()
+        )
+
+    def test_server_timing(self):
+        response = self.client.get(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'db;dur=[\d.]+;desc="\d+ queries", view;dur=[\d.]+, '
+            r'render;dur=[\d.]+, total;dur=[\d.]+'
+        )
@@ -1,37 +1,83 @@
-from django.http import FileResponse
-from django.db.models import Exists, OuterRef, Sum
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers
+)
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from rest_framework import filters, status, viewsets
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
+from api.cache import (
+    get_catalog_body,
+    get_catalog_version,
+    get_recipe_cards,
+    personalize_recipe_cards
+)
+from api.const import (
+    BULK_ADDED,
+    BULK_ALREADY_ADDED,
+    BULK_NOT_ADDED,
+    BULK_NOT_FOUND,
+    BULK_REMOVED,
+    CATALOG_MAX_AGE,
+    SHOP_LIST_FILENAME
+)
+from api.cook import get_cook_index
 from api.filters import RecipeFilter
-from api.pagination import UsersRecipesPagination
-from api.permissions import (
-    RecipePermission,
+from api.metrics import render_metrics
+from api.pagination import (
+    CursorPaginationMixin,
+    RecipesCursorPagination,
+    SubscriptionsCursorPagination,
+    UsersRecipesPagination
+)
+from api.permissions import RecipePermission
+from api.renderers import (
+    ShopListCSVRenderer,
+    ShopListJSONRenderer,
+    ShopListRenderer,
+    ShopListTextRenderer,
+    TimedJSONRenderer
 )
+from api.search import search_ingredients
 from api.serializers import (
-    FavoriteCreateSerializer,
-    ShopCreateSerializer,
+    CookQuerySerializer,
+    FavoriteShopSubscriptSerializer,
     IngredientSerializer,
-    RecipeSerializer,
     RecipeCreateSerializer,
+    RecipeIdsSerializer,
+    RecipeSerializer,
     ShortLinkSerializer,
     SubscriptionSerializer,
-    SubscriptionCreateSerializer,
     TagSerializer,
     UserAvatarSerializer,
+    get_recipe_prefetch,
+    get_recipes_limit
 )
-
+from recipes.const import SIMILAR_RECIPES_COUNT
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredientsAmount,
     Shop,
+    ShopIngredient,
     Tag,
     User
 )
@@ -40,10 +86,13 @@ from users.models import Subscription
 # ==========================Users==============================================
 
 
-class FoodUserViewSet(UserViewSet):
+class FoodUserViewSet(CursorPaginationMixin, UserViewSet):
     """Redefinition UserViewSet."""
 
     pagination_class = UsersRecipesPagination
+    cursor_pagination_classes = {
+        'subscriptions': SubscriptionsCursorPagination
+    }
 
     @action(
         methods=('put',),
@@ -87,17 +136,57 @@ class FoodUserViewSet(UserViewSet):
         user = request.user
         queryset = User.objects.filter(
             author_subscriptions__user=user
-        )
+        ).annotate(
+            subscription_id=F('author_subscriptions__id')
+        ).order_by('-subscription_id')
         page = self.paginate_queryset(queryset)
-        if page:
-            context = {'request': self.request}
-            serializer = SubscriptionSerializer(
+        context = {
+            'request': request,
+            'recipes_preview': self.get_recipes_preview(
                 page,
-                many=True,
-                context=context
+                get_recipes_limit(request)
+            )
+        }
+        serializer = SubscriptionSerializer(
+            page,
+            many=True,
+            context=context
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def get_recipes_preview(authors, recipes_limit):
+        """Return {author_id: [recipes]} with one query for all authors.
+
+        Recipes are numbered by ROW_NUMBER() inside every author partition,
+        so the limit is applied per author on the database side.
+        """
+        if not authors:
+            return {}
+        recipes = Recipe.objects.filter(author__in=authors)
+        if recipes_limit is None:
+            recipes = recipes.only('id', 'name', 'image', 'cooking_time',
+                                   'author_id')
+        else:
+            sql, params = recipes.annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=(F('created_at').desc(), F('id').desc())
+                )
+            ).values(
+                'id', 'name', 'image', 'cooking_time', 'author_id',
+                'created_at', 'row_number'
+            ).query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+                f'ORDER BY created_at DESC, id DESC',
+                (*params, recipes_limit)
             )
-            return self.get_paginated_response(serializer.data)
-        return Response(status=status.HTTP_200_OK)
+        recipes_preview = {}
+        for recipe in recipes:
+            recipes_preview.setdefault(recipe.author_id, []).append(recipe)
+        return recipes_preview
 
     @action(
         methods=('post',),
@@ -106,56 +195,107 @@ class FoodUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def create_subscription(self, request, id):
-        author = get_object_or_404(User, pk=id)
-        user = request.user
-        serializer = SubscriptionCreateSerializer(
-            data={'user': user.id, 'author': author.id},
-            context={'request': request}
+        if int(id) == request.user.id:
+            raise ValidationError(
+                {'subscription error': 'Нельзя подписаться на себя.'}
+            )
+        author = Subscription.add(user_id=request.user.id, author_id=id)
+        if author is None:
+            get_object_or_404(User, pk=id)
+            raise ValidationError(
+                {'subscription error': 'Подписка уже есть.'}
+            )
+        return Response(
+            SubscriptionSerializer(author, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
         )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @create_subscription.mapping.delete
     def delete_subscription(self, request, id):
-        author = get_object_or_404(User, pk=id)
-        user = request.user
-        delete_status, delete_dict = Subscription.objects.filter(
-            user=user, author=author
-        ).delete()
-        if delete_status:
+        if Subscription.remove(user_id=request.user.id, author_id=id):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, pk=id)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 # =============================Recipes=======================================
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class CatalogViewSet(viewsets.ReadOnlyModelViewSet):
+    """Read only catalog with conditional GET support.
+
+    List responses carry ETag and Last-Modified of catalog version and
+    unchanged data gets 304. Unfiltered list body is rendered once per
+    version.
+    """
+
+    def list(self, request, *args, **kwargs):
+        catalog = self.queryset.model._meta.model_name
+        version = self.catalog_version = get_catalog_version(catalog)
+        query = request.GET.urlencode()
+        etag = f'"{catalog}-{version}"'
+        if query:
+            etag = (f'"{catalog}-{version}-'
+                    f'{hashlib.md5(query.encode()).hexdigest()}"')
+        last_modified = version // 10 ** 6
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified
+        )
+        if response is None and query:
+            response = self.list_filtered(request, *args, **kwargs)
+        elif response is None:
+            response = HttpResponse(
+                get_catalog_body(
+                    catalog,
+                    version,
+                    lambda: self.get_serializer(
+                        self.get_queryset(), many=True
+                    ).data
+                ),
+                content_type='application/json'
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, max_age=CATALOG_MAX_AGE)
+        return response
+
+    def list_filtered(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class TagViewSet(CatalogViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
+
+    def list_filtered(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list_filtered(request, *args, **kwargs)
+        return Response(
+            search_ingredients(name, version=self.catalog_version)
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     pagination_class = UsersRecipesPagination
+    cursor_pagination_classes = {'list': RecipesCursorPagination}
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (RecipePermission,)
 
     def get_queryset(self):
-        queryset = Recipe.objects.select_related(
-            'author'
-        ).prefetch_related(
-            'tags',
-            'ingredients'
-        )
+        queryset = Recipe.objects.select_related('author')
+        # Writes read ingredients and tags under lock, the response
+        # prefetches them again.
+        if self.action not in ('update', 'partial_update', 'destroy'):
+            queryset = queryset.prefetch_related(*get_recipe_prefetch())
         user = self.request.user
         if user.is_authenticated:
             is_favorited = user.favorite_set.filter(
@@ -170,6 +310,35 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         return queryset
 
+    def list(self, request):
+        queryset = self.filter_queryset(Recipe.objects.all())
+        page = self.paginate_queryset(queryset.values('id', 'created_at'))
+        return self.get_paginated_response(personalize_recipe_cards(
+            get_recipe_cards([recipe['id'] for recipe in page]),
+            request
+        ))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # Subtract the recipe from carts at once rather than in signals
+        # for every cascade deleted ingredient amount.
+        ShopIngredient.remove_recipes(recipe_id=instance.id)
+        RecipeIngredientsAmount.delete_quietly(instance.id)
+        instance.delete()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        # Errors of shopping list download, e.g. 401 or unknown ?format=,
+        # are JSON rather than a text or CSV attachment.
+        if isinstance(response, Response) and isinstance(
+            response.accepted_renderer, ShopListRenderer
+        ):
+            response.accepted_renderer = TimedJSONRenderer()
+            response.accepted_media_type = TimedJSONRenderer.media_type
+        return response
+
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
             return RecipeCreateSerializer
@@ -187,28 +356,49 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = ShortLinkSerializer(recipe)
         return Response(serializer.data)
 
+# -----------similar recipes-------------------------------------
+
+    @action(
+        methods=('get',),
+        detail=False,
+        url_path=r'(?P<id>\d+)/similar'
+    )
+    def similar(self, request, id):
+        """Recipes precomputed by compute_similar_recipes, best first."""
+        recipes = Recipe.objects.filter(similar_to__recipe_id=id).order_by(
+            '-similar_to__score', '-id'
+        )[:SIMILAR_RECIPES_COUNT]
+        data = FavoriteShopSubscriptSerializer(
+            recipes,
+            many=True,
+            context={'request': request}
+        ).data
+        if not data:
+            get_object_or_404(Recipe, pk=id)
+        return Response(data)
+
 # ---------------------------------------------
 
     @staticmethod
-    def create_favorite_shop(serializer, pk, request):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        user = request.user
-        serializer = serializer(
-            data={'user': user.id, 'recipe': recipe.id},
+    def add_favorite_shop(model, request, id):
+        """Add recipe to favorites or shop list, return its short data."""
+        recipe = model.add(user_id=request.user.id, recipe_id=id)
+        if recipe is None:
+            get_object_or_404(Recipe, pk=id)
+            raise ValidationError(
+                {f'{model._meta.verbose_name} error': 'Был добавлен ранее.'}
+            )
+        return FavoriteShopSubscriptSerializer(
+            recipe,
             context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return serializer
+        ).data
 
     @staticmethod
-    def shop_list(shop_ingredients):
-        shop_list_text = 'название, ед.изм., кол-во'
-        for item in shop_ingredients:
-            shop_list_text += (f'\n{item["ingredient__name"]}'
-                               f', {item["ingredient__measurement_unit"]}'
-                               f', {item["amount"]}')
-        return shop_list_text
+    def delete_favorite_shop(model, request, id):
+        if model.remove(user_id=request.user.id, recipe_id=id):
+            return True
+        get_object_or_404(Recipe, pk=id)
+        return False
 
 # ------------favorite_add_delete-----------------------------------------
 
@@ -219,21 +409,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def add_favorite(self, request, id):
         return Response(
-            self.create_favorite_shop(
-                serializer=FavoriteCreateSerializer,
-                pk=id,
-                request=request
-            ).data,
+            self.add_favorite_shop(Favorite, request, id),
             status=status.HTTP_201_CREATED
         )
 
     @add_favorite.mapping.delete
     def delete_favorite(self, request, id):
-        delete_status, delete_dict = Favorite.objects.filter(
-            user=request.user,
-            recipe=get_object_or_404(Recipe, pk=id)
-        ).delete()
-        if delete_status:
+        if self.delete_favorite_shop(Favorite, request, id):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -244,44 +426,195 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=False,
         url_path=r'(?P<id>\d+)/shopping_cart'
     )
+    @transaction.atomic
     def add_shop(self, request, id):
-        return Response(
-            self.create_favorite_shop(
-                serializer=ShopCreateSerializer,
-                pk=id,
-                request=request
-            ).data,
-            status=status.HTTP_201_CREATED
-        )
+        data = self.add_favorite_shop(Shop, request, id)
+        ShopIngredient.add_user_recipes(request.user.id, (id,))
+        return Response(data, status=status.HTTP_201_CREATED)
 
     @add_shop.mapping.delete
+    @transaction.atomic
     def delete_shop(self, request, id):
-        delete_status, delete_dict = Shop.objects.filter(
-            user=request.user,
-            recipe=get_object_or_404(Recipe, pk=id)
-        ).delete()
-        if delete_status:
+        if self.delete_favorite_shop(Shop, request, id):
+            ShopIngredient.remove_user_recipes(request.user.id, (id,))
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+# --------------bulk favorite and shop cart------------------------
+
+    @staticmethod
+    def get_bulk_recipe_ids(request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    @staticmethod
+    def get_bulk_response(recipe_ids, changed, changed_status,
+                          unchanged_status):
+        """Return status of every requested recipe id.
+
+        Existence is queried only for ids which were not changed.
+        """
+        unchanged = [
+            recipe_id for recipe_id in recipe_ids if recipe_id not in changed
+        ]
+        existing = set(Recipe.objects.filter(
+            id__in=unchanged
+        ).values_list('id', flat=True)) if unchanged else set()
+        return Response({'results': [
+            {
+                'id': recipe_id,
+                'status': (
+                    changed_status if recipe_id in changed
+                    else unchanged_status if recipe_id in existing
+                    else BULK_NOT_FOUND
+                )
+            }
+            for recipe_id in recipe_ids
+        ]})
+
+    @action(
+        methods=('post',),
+        detail=False,
+        url_path='favorite',
+        permission_classes=(IsAuthenticated,)
+    )
+    def add_favorites(self, request):
+        recipe_ids = self.get_bulk_recipe_ids(request)
+        return self.get_bulk_response(
+            recipe_ids,
+            Favorite.add_many(request.user.id, recipe_ids),
+            BULK_ADDED,
+            BULK_ALREADY_ADDED
+        )
+
+    @add_favorites.mapping.delete
+    def delete_favorites(self, request):
+        recipe_ids = self.get_bulk_recipe_ids(request)
+        return self.get_bulk_response(
+            recipe_ids,
+            Favorite.remove_many(request.user.id, recipe_ids),
+            BULK_REMOVED,
+            BULK_NOT_ADDED
+        )
+
+    @action(
+        methods=('post',),
+        detail=False,
+        url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,)
+    )
+    @transaction.atomic
+    def add_shops(self, request):
+        recipe_ids = self.get_bulk_recipe_ids(request)
+        added = Shop.add_many(request.user.id, recipe_ids)
+        if added:
+            ShopIngredient.add_user_recipes(request.user.id, added)
+        return self.get_bulk_response(
+            recipe_ids, added, BULK_ADDED, BULK_ALREADY_ADDED
+        )
+
+    @add_shops.mapping.delete
+    @transaction.atomic
+    def delete_shops(self, request):
+        recipe_ids = self.get_bulk_recipe_ids(request)
+        removed = Shop.remove_many(request.user.id, recipe_ids)
+        if removed:
+            ShopIngredient.remove_user_recipes(request.user.id, removed)
+        return self.get_bulk_response(
+            recipe_ids, removed, BULK_REMOVED, BULK_NOT_ADDED
+        )
+
+    @action(
+        methods=('delete',),
+        detail=False,
+        url_path='shopping_cart/clear',
+        permission_classes=(IsAuthenticated,)
+    )
+    @transaction.atomic
+    def clear_shop(self, request):
+        Shop.remove_many(request.user.id)
+        request.user.shop_ingredients.all().delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# --------------------what can I cook-----------------------------------
+
+    @action(
+        methods=('get',),
+        detail=False,
+        url_path='cook'
+    )
+    def cook(self, request):
+        """Recipes ranked by share of their ingredients user has."""
+        serializer = CookQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            get_cook_index().search(**serializer.validated_data)
+        )
+        cards = {
+            card['id']: card
+            for card in personalize_recipe_cards(
+                get_recipe_cards([found['id'] for found in page]),
+                request
+            )
+        }
+        return self.get_paginated_response([
+            {**cards[found['id']], **found}
+            for found in page
+            if found['id'] in cards
+        ])
+
 # --------------------download shop list-------------------------------
 
     @action(
         methods=('get',),
         detail=False,
-        url_path='download_shopping_cart'
+        url_path='download_shopping_cart',
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            ShopListTextRenderer,
+            ShopListCSVRenderer,
+            ShopListJSONRenderer
+        )
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        shop_ingredients = RecipeIngredientsAmount.objects.filter(
-            recipe__shop_set__user=user
-        ).values(
+        shop_ingredients = request.user.shop_ingredients.values(
             'ingredient__name',
             'ingredient__measurement_unit',
-        ).annotate(
-            amount=Sum('amount')
+            'amount'
         ).order_by('ingredient__name')
-        return FileResponse(
-            self.shop_list(shop_ingredients),
-            content_type='text'
+        renderer = request.accepted_renderer
+        content = renderer.stream(shop_ingredients.iterator())
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if re_accepts_gzip.search(accept_encoding):
+            content = compress_sequence(
+                chunk.encode(renderer.charset) for chunk in content
+            )
+            response = StreamingHttpResponse(content)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = StreamingHttpResponse(content)
+        response['Content-Type'] = (
+            f'{renderer.media_type}; charset={renderer.charset}'
         )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{SHOP_LIST_FILENAME}.{renderer.format}"'
+        )
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+def metrics_view(request):
+    """Prometheus text exposition of MetricsMiddleware histograms."""
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    elif not constant_time_compare(
+        request.headers.get('Authorization', ''),
+        f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(
+        render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -31,11 +31,11 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'djoser',
-    'debug_toolbar',   # для DjDT
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -43,9 +43,22 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',   # для DjDT
 ]
 
+# для DjDT, только при отладке: панель дорогая под нагрузкой
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# warn или raise: проверять QUERY_BUDGETS и повторы SQL в каждом запросе
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', default='')
+if QUERY_BUDGET_MODE:
+    MIDDLEWARE.insert(1, 'api.middleware.QueryBudgetMiddleware')
+
+# /metrics требует заголовок Authorization: Bearer <токен>, без токена
+# доступен только при DEBUG
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
 # для DjDT
 INTERNAL_IPS = [
     '127.0.0.1',
@@ -91,6 +104,16 @@ else:
         }
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -138,6 +161,10 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'SEARCH_PARAM': 'name',
 }
 
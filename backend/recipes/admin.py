@@ -14,16 +14,19 @@ class RecipeIngredientsAmountInline(admin.TabularInline):
     model = RecipeIngredientsAmount
     min_num = 1
     extra = 0
+    autocomplete_fields = ('ingredient',)
 
 
 class FavoriteInline(admin.TabularInline):
     model = Favorite
     extra = 0
+    autocomplete_fields = ('user',)
 
 
 class ShopInline(admin.TabularInline):
     model = Shop
     extra = 0
+    autocomplete_fields = ('user',)
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -36,19 +39,31 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_ingredients',
         'short_link'
     )
-    search_fields = ('author',)
+    search_fields = ('name', 'author__username')
     list_filter = ('tags',)
     list_display_links = ('name',)
     filter_horizontal = ('tags',)
+    autocomplete_fields = ('author',)
     inlines = (
         RecipeIngredientsAmountInline,
         FavoriteInline,
         ShopInline,
     )
 
-    @admin.display(description='Кол-во добавлений в избранное')
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            'ingredients'
+        )
+
+    @admin.display(
+        description='Кол-во добавлений в избранное',
+        ordering='favorites_count'
+    )
     def get_is_favorite(self, obj):
-        return obj.favorite_set.count()
+        return obj.favorites_count
 
     @admin.display(description='Теги')
     def get_tags(self, obj):
@@ -68,8 +83,9 @@ class IngredientAdmin(admin.ModelAdmin):
     )
     list_editable = ('measurement_unit',)
     search_fields = ('name',)
-    list_filter = ('name',)
+    list_filter = ('measurement_unit',)
     list_display_links = ('name',)
+    ordering = ('name',)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -88,9 +104,10 @@ class FavoriteAdmin(admin.ModelAdmin):
         'user',
         'recipe',
     )
-    search_fields = ('recipe',)
-    list_filter = ('user',)
+    search_fields = ('recipe__name', 'user__email', 'user__username')
     list_display_links = ('user',)
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
 
 
 class ShopAdmin(admin.ModelAdmin):
@@ -98,9 +115,10 @@ class ShopAdmin(admin.ModelAdmin):
         'user',
         'recipe',
     )
-    search_fields = ('recipe',)
-    list_filter = ('user',)
+    search_fields = ('recipe__name', 'user__email', 'user__username')
     list_display_links = ('user',)
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
 
 
 admin.site.register(Ingredient, IngredientAdmin)
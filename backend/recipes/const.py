@@ -3,6 +3,16 @@ INGREDIENT_NAME_LENGTH = 128
 TITLE_LENGTH = 200
 TAG_LENGTH = 32
 MEASUREMENT_UNIT_LENGTH = 64
+CATALOG_NAME_LENGTH = 32
 MIN_VALUE = 1
 MAX_VALUE = 32767
 MIN_S_LENGTH = 5
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+NDJSON_FORMAT = 'foodgram-ndjson-1'
+GENERATE_BATCH_SIZE = 10000
+SIMILAR_RECIPES_COUNT = 10
+# Features found in larger share of recipes only add to scores of
+# candidates, they do not bring candidates themselves.
+SIMILAR_MAX_DF = 0.05
+SIMILAR_BATCH_SIZE = 1000
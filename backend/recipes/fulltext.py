@@ -0,0 +1,100 @@
+"""Full-text index of recipe name and text.
+
+PostgreSQL keeps tsvector column search_vector with GIN index, SQLite
+keeps FTS5 table recipes_recipe_fts. Both are filled by triggers, so
+ORM saves, queryset updates and raw inserts of generate_dataset and
+import_recipes are indexed alike. The column is not a model field:
+Django 3.2 would write NULL into it on every save.
+"""
+from django.db import connections
+
+SEARCH_CONFIG = 'russian'
+SEARCH_TABLE = 'recipes_recipe_fts'
+SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+    "coalesce({row}name, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+    "coalesce({row}text, '')), 'B')"
+)
+
+POSTGRESQL_CREATE = (
+    'ALTER TABLE recipes_recipe '
+    'ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    'CREATE OR REPLACE FUNCTION recipes_recipe_search_vector() '
+    'RETURNS trigger AS $$ BEGIN '
+    f'NEW.search_vector := {SEARCH_VECTOR.format(row="NEW.")}; '
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe',
+    'CREATE TRIGGER recipes_recipe_search_vector '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector()',
+    'UPDATE recipes_recipe '
+    f'SET search_vector = {SEARCH_VECTOR.format(row="")}',
+    'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+    'ON recipes_recipe USING GIN (search_vector)',
+)
+POSTGRESQL_DROP = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector()',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+SQLITE_TRIGGERS = (
+    f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert '
+    'AFTER INSERT ON recipes_recipe BEGIN '
+    f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+    f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete '
+    'AFTER DELETE ON recipes_recipe BEGIN '
+    f'INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); END",
+    f'CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+    f'INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, text) '
+    "VALUES ('delete', old.id, old.name, old.text); "
+    f'INSERT INTO {SEARCH_TABLE} (rowid, name, text) '
+    'VALUES (new.id, new.name, new.text); END',
+)
+SQLITE_CREATE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+    "name, text, content='recipes_recipe', content_rowid='id')",
+    *SQLITE_TRIGGERS,
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')",
+)
+SQLITE_DROP = (
+    *(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{event}'
+      for event in ('insert', 'delete', 'update')),
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+)
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_CREATE, POSTGRESQL_DROP),
+    'sqlite': (SQLITE_CREATE, SQLITE_DROP),
+}
+
+
+def create_search_index(apps, schema_editor):
+    create, drop = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for sql in create:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    create, drop = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for sql in drop:
+        schema_editor.execute(sql)
+
+
+def restore_search_triggers(using, **kwargs):
+    """Recreate SQLite triggers after migrations.
+
+    SQLite schema editor alters recipes_recipe by copying it into a new
+    table, which drops triggers of the old one. Rows keep their ids, so
+    the FTS5 table itself stays valid.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if SEARCH_TABLE not in connection.introspection.table_names(cursor):
+            return
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
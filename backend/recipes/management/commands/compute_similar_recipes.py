@@ -0,0 +1,128 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min
+
+from recipes.const import SIMILAR_BATCH_SIZE, SIMILAR_RECIPES_COUNT
+from recipes.models import RecipeFingerprint, SimilarRecipe
+from recipes.similarity import RecipeVectors
+
+
+class Command(BaseCommand):
+    help = 'Precompute top similar recipes by ingredients and tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count', type=int, default=SIMILAR_RECIPES_COUNT
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute all recipes, not only changed ones.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=SIMILAR_BATCH_SIZE
+        )
+
+    def log(self, message):
+        self.stdout.write(
+            f'{message} за {time.monotonic() - self.started:.1f} с.'
+        )
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+        count = options['count']
+        vectors = RecipeVectors.load()
+        digests = {
+            recipe_id: vectors.get_digest(recipe_id)
+            for recipe_id in vectors.recipe_ids.tolist()
+        }
+        stored = dict(
+            RecipeFingerprint.objects.values_list('recipe_id', 'digest')
+        )
+        changed = {
+            recipe_id for recipe_id, digest in digests.items()
+            if stored.get(recipe_id) != digest
+        }
+        removed = stored.keys() - digests.keys()
+        self.log(
+            f'Рецептов: {len(digests)}, изменено: {len(changed)}, '
+            f'без ингредиентов и тегов: {len(removed)}'
+        )
+        if options['full'] or len(changed) * 2 > len(digests):
+            refresh = set(digests)
+        else:
+            refresh = self.get_affected(
+                vectors, changed | removed, count, options['batch_size']
+            )
+        SimilarRecipe.objects.filter(recipe_id__in=removed).delete()
+        RecipeFingerprint.objects.filter(recipe_id__in=removed).delete()
+        refresh = sorted(refresh)
+        batch_size = options['batch_size']
+        for start in range(0, len(refresh), batch_size):
+            self.save_batch(
+                vectors,
+                refresh[start:start + batch_size],
+                count,
+                {
+                    recipe_id: digests[recipe_id]
+                    for recipe_id in refresh[start:start + batch_size]
+                    if recipe_id in changed
+                }
+            )
+            self.log(f'Обновлено: {min(start + batch_size, len(refresh))}')
+
+    @staticmethod
+    def get_affected(vectors, changed, count, batch_size):
+        """Return changed recipes and recipes whose top may have changed.
+
+        Those are recipes listing a changed one, recipes with incomplete
+        list and recipes to which a changed one got closer than their
+        worst neighbour.
+        """
+        affected = set(changed)
+        changed = sorted(changed)
+        for start in range(0, len(changed), batch_size):
+            affected.update(SimilarRecipe.objects.filter(
+                similar_id__in=changed[start:start + batch_size]
+            ).values_list('recipe_id', flat=True))
+        worst = np.full(len(vectors.norms), -1.0)
+        for recipe_id, score, total in SimilarRecipe.objects.values(
+            'recipe_id'
+        ).annotate(
+            score=Min('score'), total=Count('id')
+        ).values_list('recipe_id', 'score', 'total').iterator():
+            if total < count:
+                affected.add(recipe_id)
+            elif recipe_id < len(worst):
+                worst[recipe_id] = score
+        for recipe_id in changed:
+            candidates, scores = vectors.get_scores(recipe_id, count)
+            affected.update(
+                candidates[scores > worst[candidates]].tolist()
+            )
+        return affected
+
+    @staticmethod
+    @transaction.atomic
+    def save_batch(vectors, recipe_ids, count, digests):
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        similar = []
+        for recipe_id in recipe_ids:
+            neighbours, scores = vectors.get_neighbours(recipe_id, count)
+            similar.extend(
+                SimilarRecipe(
+                    recipe_id=recipe_id, similar_id=neighbour, score=score
+                )
+                for neighbour, score in zip(
+                    neighbours.tolist(), scores.tolist()
+                )
+            )
+        SimilarRecipe.objects.bulk_create(similar)
+        RecipeFingerprint.objects.filter(recipe_id__in=digests).delete()
+        RecipeFingerprint.objects.bulk_create(
+            RecipeFingerprint(recipe_id=recipe_id, digest=digest)
+            for recipe_id, digest in digests.items()
+        )
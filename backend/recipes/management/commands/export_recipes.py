@@ -0,0 +1,84 @@
+import base64
+import sys
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipes.const import EXPORT_CHUNK_SIZE, NDJSON_FORMAT
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredientsAmount,
+    Shop,
+    Tag
+)
+from users.models import FoodUser, Subscription
+
+# (record type, model, exported fields, image field) in import order.
+RECORDS = (
+    ('tag', Tag, ('id', 'name', 'slug'), None),
+    ('ingredient', Ingredient, ('id', 'name', 'measurement_unit'), None),
+    ('user', FoodUser, (
+        'id', 'email', 'username', 'first_name', 'last_name', 'password',
+        'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login',
+        'avatar'
+    ), 'avatar'),
+    ('recipe', Recipe, (
+        'id', 'author_id', 'name', 'text', 'cooking_time', 'created_at',
+        'image'
+    ), 'image'),
+    ('recipe_tag', Recipe.tags.through, ('recipe_id', 'tag_id'), None),
+    ('amount', RecipeIngredientsAmount,
+     ('recipe_id', 'ingredient_id', 'amount'), None),
+    ('favorite', Favorite, ('user_id', 'recipe_id'), None),
+    ('shop', Shop, ('user_id', 'recipe_id'), None),
+    ('subscription', Subscription, ('user_id', 'author_id'), None),
+)
+
+
+class Command(BaseCommand):
+    help = 'Export users, recipes and related data as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file_path',
+            nargs='?',
+            default='-',
+            help='Файл для выгрузки, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--skip-images',
+            action='store_true',
+            help='Не включать содержимое изображений, только пути.'
+        )
+
+    def handle(self, *args, **options):
+        if options['file_path'] == '-':
+            self.export(sys.stdout, options['skip_images'])
+            return
+        with open(options['file_path'], mode='w', encoding='utf-8') as f:
+            self.export(f, options['skip_images'])
+        self.stderr.write(f'Выгрузка записана в {options["file_path"]}.')
+
+    def export(self, file, skip_images):
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        file.write(encoder.encode({'format': NDJSON_FORMAT}) + '\n')
+        for record_type, model, fields, image_field in RECORDS:
+            rows = model.objects.order_by('pk').values_list(*fields)
+            for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                record = {'type': record_type, **dict(zip(fields, row))}
+                if image_field and record[image_field] and not skip_images:
+                    record[f'{image_field}_data'] = self.read_image(
+                        record[image_field]
+                    )
+                file.write(encoder.encode(record) + '\n')
+
+    @staticmethod
+    def read_image(name):
+        try:
+            with default_storage.open(name, 'rb') as image:
+                return base64.b64encode(image.read()).decode()
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,259 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+
+from api.cache import bump_catalog_version, bump_recipe_card_version
+from recipes.const import GENERATE_BATCH_SIZE
+from recipes.management.commands.import_recipes import reset_sequences
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredientsAmount,
+    Shop,
+    Tag
+)
+from users.models import FoodUser, Subscription
+
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'),
+    ('Обед', 'lunch'),
+    ('Ужин', 'dinner'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'запеканка', 'рагу', 'омлет', 'паста',
+    'соус', 'котлеты', 'блины', 'торт', 'плов', 'борщ', 'жаркое', 'рулет',
+    'домашний', 'быстрый', 'летний', 'острый', 'сладкий', 'овощной',
+    'куриный', 'рыбный', 'грибной', 'сырный', 'по-деревенски', 'с травами',
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500, 1000)
+IMAGE = 'recipes/images/generated.png'
+# Fixed point in time, so dataset is the same for the same seed.
+DATASET_NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def zipf_weights(size, exponent):
+    """Return cumulative weights of Zipf distribution over ranks."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, recipes, favorites, carts, follows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=10)
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Показатель распределения Ципфа для популярности.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=GENERATE_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.zipf = options['zipf']
+        self.started = time.monotonic()
+        self.ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not self.ingredient_ids:
+            raise CommandError(
+                'Каталог ингредиентов пуст, выполните load_ingredients.'
+            )
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS
+            )
+            bump_catalog_version('tag')
+        self.tag_ids = list(
+            Tag.objects.order_by('id').values_list('id', flat=True)
+        )
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            recipe_ids = self.create_recipes(options['recipes'], user_ids)
+            self.create_links(
+                Favorite, user_ids, recipe_ids,
+                options['favorites_per_user']
+            )
+            self.create_links(
+                Shop, user_ids, recipe_ids, options['carts_per_user']
+            )
+            self.create_subscriptions(
+                user_ids, options['subscriptions_per_user']
+            )
+            reset_sequences((FoodUser, Recipe))
+        call_command('repair_counters', stdout=self.stdout)
+        call_command('rebuild_shop_lists', stdout=self.stdout)
+        bump_recipe_card_version()
+        self.log('Генерация закончилась')
+
+    def log(self, message):
+        self.stdout.write(
+            f'{message} за {time.monotonic() - self.started:.1f} с.'
+        )
+
+    def insert(self, model, columns, rows):
+        """INSERT rows with multi-row VALUES statements, batch by batch."""
+        per_statement = (
+            (connection.features.max_query_params or 30000) // len(columns)
+        )
+        per_statement = min(per_statement, self.batch_size)
+        placeholder = f'({", ".join(["%s"] * len(columns))})'
+        batch = []
+        with connection.cursor() as cursor:
+            for row in rows:
+                batch.append(row)
+                if len(batch) == per_statement:
+                    self.execute_insert(
+                        cursor, model, columns, placeholder, batch
+                    )
+                    batch = []
+            if batch:
+                self.execute_insert(cursor, model, columns, placeholder, batch)
+
+    @staticmethod
+    def execute_insert(cursor, model, columns, placeholder, batch):
+        quote = connection.ops.quote_name
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} '
+            f'({", ".join(quote(column) for column in columns)}) '
+            f'VALUES {", ".join([placeholder] * len(batch))}',
+            [value for row in batch for value in row]
+        )
+
+    def create_users(self, count):
+        first_id = (FoodUser.objects.aggregate(last=Max('id'))['last']
+                    or 0) + 1
+        password = make_password(None)
+        user_ids = range(first_id, first_id + count)
+        self.insert(
+            FoodUser,
+            ('id', 'email', 'username', 'first_name', 'last_name', 'password',
+             'is_active', 'is_staff', 'is_superuser', 'date_joined',
+             'recipes_count', 'followers_count'),
+            (
+                (user_id, f'user{user_id}@example.com', f'user{user_id}',
+                 'Имя', 'Фамилия', password, True, False, False, DATASET_NOW,
+                 0, 0)
+                for user_id in user_ids
+            )
+        )
+        self.log(f'Пользователей: {count}')
+        return user_ids
+
+    def create_recipes(self, count, user_ids):
+        rng = self.rng
+        first_id = (Recipe.objects.aggregate(last=Max('id'))['last']
+                    or 0) + 1
+        recipe_ids = range(first_id, first_id + count)
+        authors = rng.sample(user_ids, len(user_ids))
+        author_weights = zipf_weights(len(authors), self.zipf)
+        ingredient_weights = zipf_weights(
+            len(self.ingredient_ids), self.zipf
+        )
+        ingredients = rng.sample(
+            self.ingredient_ids, len(self.ingredient_ids)
+        )
+        tag_weights = zipf_weights(len(self.tag_ids), self.zipf)
+        for start in range(0, count, self.batch_size):
+            recipes, amounts, tags = [], [], []
+            for recipe_id in recipe_ids[start:start + self.batch_size]:
+                recipes.append((
+                    recipe_id,
+                    rng.choices(authors, cum_weights=author_weights)[0],
+                    ' '.join(rng.sample(WORDS, 3)).capitalize(),
+                    ' '.join(rng.choices(WORDS, k=40)),
+                    rng.randint(5, 180),
+                    DATASET_NOW - timedelta(
+                        seconds=rng.randint(0, 365 * 86400)
+                    ),
+                    IMAGE, 0, 0
+                ))
+                size = min(
+                    max(2, round(rng.gauss(9, 3.5))), 25, len(ingredients)
+                )
+                chosen = set()
+                while len(chosen) < size:
+                    chosen.update(rng.choices(
+                        ingredients, cum_weights=ingredient_weights,
+                        k=size - len(chosen)
+                    ))
+                amounts.extend(
+                    (recipe_id, ingredient_id, rng.choice(AMOUNTS))
+                    for ingredient_id in sorted(chosen)
+                )
+                tags.extend(
+                    (recipe_id, tag_id)
+                    for tag_id in sorted(set(rng.choices(
+                        self.tag_ids, cum_weights=tag_weights,
+                        k=rng.randint(1, 3)
+                    )))
+                )
+            self.insert(
+                Recipe,
+                ('id', 'author_id', 'name', 'text', 'cooking_time',
+                 'created_at', 'image', 'favorites_count', 'in_carts_count'),
+                recipes
+            )
+            self.insert(
+                RecipeIngredientsAmount,
+                ('recipe_id', 'ingredient_id', 'amount'),
+                amounts
+            )
+            self.insert(Recipe.tags.through, ('recipe_id', 'tag_id'), tags)
+            self.log(f'Рецептов: {start + len(recipes)}')
+        return recipe_ids
+
+    def create_links(self, model, user_ids, recipe_ids, mean):
+        """Add Zipf-skewed user-recipe pairs, about mean per user."""
+        rng = self.rng
+        recipes = rng.sample(recipe_ids, len(recipe_ids))
+        weights = zipf_weights(len(recipes), self.zipf)
+
+        def links():
+            for user_id in user_ids:
+                size = min(len(recipes), int(rng.expovariate(1 / mean)))
+                for recipe_id in sorted(set(rng.choices(
+                    recipes, cum_weights=weights, k=size
+                ))):
+                    yield user_id, recipe_id
+
+        self.insert(model, ('user_id', 'recipe_id'), links())
+        self.log(f'{model._meta.verbose_name_plural}')
+
+    def create_subscriptions(self, user_ids, mean):
+        rng = self.rng
+        authors = rng.sample(user_ids, len(user_ids))
+        weights = zipf_weights(len(authors), self.zipf)
+
+        def subscriptions():
+            for user_id in user_ids:
+                size = min(len(authors), int(rng.expovariate(1 / mean)))
+                for author_id in sorted(set(rng.choices(
+                    authors, cum_weights=weights, k=size
+                ))):
+                    if author_id != user_id:
+                        yield user_id, author_id
+
+        self.insert(Subscription, ('user_id', 'author_id'), subscriptions())
+        self.log('Подписки')
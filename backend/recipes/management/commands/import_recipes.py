@@ -0,0 +1,198 @@
+import base64
+import json
+import time
+from itertools import groupby, islice
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.sql import InsertQuery
+
+from api.cache import bump_catalog_version, bump_recipe_card_version
+from recipes.const import IMPORT_BATCH_SIZE, NDJSON_FORMAT
+from recipes.management.commands.export_recipes import RECORDS
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import FoodUser
+
+# record type: (model field, record type of referenced id)
+FOREIGN_KEYS = {
+    'recipe': {'author_id': 'user'},
+    'recipe_tag': {'recipe_id': 'recipe', 'tag_id': 'tag'},
+    'amount': {'recipe_id': 'recipe', 'ingredient_id': 'ingredient'},
+    'favorite': {'user_id': 'user', 'recipe_id': 'recipe'},
+    'shop': {'user_id': 'user', 'recipe_id': 'recipe'},
+    'subscription': {'user_id': 'user', 'author_id': 'user'},
+}
+# record type: natural key field used to merge with existing rows
+NATURAL_KEYS = {'tag': 'slug', 'ingredient': 'name', 'user': 'email'}
+
+
+def reset_sequences(models):
+    """Move id sequences past rows inserted with explicit ids."""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def insert_raw(model, objs):
+    """INSERT objects as is, keeping explicit ids and created_at."""
+    fields = model._meta.concrete_fields
+    batch_size = connection.ops.bulk_batch_size(fields, objs) or len(objs)
+    for start in range(0, len(objs), batch_size):
+        query = InsertQuery(model)
+        query.insert_values(fields, objs[start:start + batch_size], raw=True)
+        query.get_compiler(connection=connection).execute_sql()
+
+
+class Command(BaseCommand):
+    help = 'Import NDJSON made by export_recipes with remapped ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--skip-images',
+            action='store_true',
+            help='Не сохранять файлы изображений, оставить пути как есть.'
+        )
+
+    def handle(self, *args, **options):
+        self.skip_images = options['skip_images']
+        self.models = {
+            record_type: (model, fields, image_field)
+            for record_type, model, fields, image_field in RECORDS
+        }
+        self.ids = {record_type: {} for record_type in NATURAL_KEYS}
+        self.ids['recipe'] = {}
+        self.last_ids = {
+            model: model.objects.aggregate(last=Max('id'))['last'] or 0
+            for model in (Tag, Ingredient, FoodUser, Recipe)
+        }
+        self.counts = {}
+        started = time.monotonic()
+        with open(options['file_path'], mode='r', encoding='utf-8') as f:
+            header = json.loads(f.readline() or '{}')
+            if header.get('format') != NDJSON_FORMAT:
+                raise CommandError('Неизвестный формат файла.')
+            records = (json.loads(line) for line in f if line.strip())
+            with transaction.atomic():
+                for record_type, group in groupby(
+                    records, key=lambda record: record['type']
+                ):
+                    while True:
+                        batch = list(islice(group, options['batch_size']))
+                        if not batch:
+                            break
+                        self.import_batch(record_type, batch)
+                reset_sequences((Tag, Ingredient, FoodUser, Recipe))
+        call_command('repair_counters', stdout=self.stdout)
+        call_command('rebuild_shop_lists', stdout=self.stdout)
+        bump_catalog_version('tag')
+        bump_catalog_version('ingredient')
+        bump_recipe_card_version()
+        total = sum(self.counts.values())
+        self.stdout.write(
+            'Загрузка закончилась. ' + ', '.join(
+                f'{record_type}: {count}'
+                for record_type, count in self.counts.items()
+            ) + f'. {total / max(time.monotonic() - started, 1e-9):.0f} '
+            f'записей/с.'
+        )
+
+    def import_batch(self, record_type, batch):
+        model, fields, image_field = self.models[record_type]
+        batch = [
+            record for record in batch
+            if self.remap(record, FOREIGN_KEYS.get(record_type, {}))
+        ]
+        if record_type in NATURAL_KEYS:
+            batch = self.merge_existing(record_type, model, batch)
+        elif record_type != 'recipe':
+            model.objects.bulk_create(
+                [
+                    model(**{field: record[field] for field in fields})
+                    for record in batch
+                ],
+                ignore_conflicts=True
+            )
+            self.counts[record_type] = (
+                self.counts.get(record_type, 0) + len(batch)
+            )
+            return
+        objs = []
+        for record in batch:
+            old_id = record['id']
+            self.last_ids[model] += 1
+            record['id'] = self.ids[record_type][old_id] = (
+                self.last_ids[model]
+            )
+            if image_field:
+                self.save_image(record, image_field)
+            objs.append(model(**{field: record[field] for field in fields}))
+        insert_raw(model, objs)
+        self.counts[record_type] = self.counts.get(record_type, 0) + len(objs)
+
+    def remap(self, record, foreign_keys):
+        """Replace exported ids by imported, False if target is missing."""
+        for field, record_type in foreign_keys.items():
+            new_id = self.ids[record_type].get(record[field])
+            if new_id is None:
+                return False
+            record[field] = new_id
+        return True
+
+    def merge_existing(self, record_type, model, batch):
+        """Map records to existing rows by natural key, return the rest."""
+        key = NATURAL_KEYS[record_type]
+        existing = dict(model.objects.filter(
+            **{f'{key}__in': [record[key] for record in batch]}
+        ).values_list(key, 'id'))
+        for record in batch:
+            if record[key] in existing:
+                self.ids[record_type][record['id']] = existing[record[key]]
+        batch = [record for record in batch if record[key] not in existing]
+        if record_type == 'user':
+            self.rename_taken_usernames(batch)
+        return batch
+
+    @staticmethod
+    def rename_taken_usernames(batch):
+        """Suffix usernames of new users taken by other users.
+
+        Suffix is exported id, then a counter, the name is cut so that
+        it fits max_length.
+        """
+        max_length = FoodUser._meta.get_field('username').max_length
+        used = set(FoodUser.objects.filter(
+            username__in=[record['username'] for record in batch]
+        ).values_list('username', flat=True))
+        for record in batch:
+            username = original = record['username']
+            number = 0
+            while username in used:
+                number += 1
+                suffix = f'_{record["id"]}' + (
+                    f'_{number}' if number > 1 else ''
+                )
+                username = original[:max_length - len(suffix)] + suffix
+                if FoodUser.objects.filter(username=username).exists():
+                    used.add(username)
+            record['username'] = username
+            used.add(username)
+
+    def save_image(self, record, image_field):
+        data = record.pop(f'{image_field}_data', None)
+        if self.skip_images or not data:
+            return
+        record[image_field] = default_storage.save(
+            record[image_field],
+            ContentFile(base64.b64decode(data))
+        )
@@ -1,13 +1,116 @@
 import csv
+import io
+import json
 import os
+import time
+from itertools import islice
 
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
 
+from api.cache import bump_catalog_version, bump_recipe_card_version
+from recipes.const import (
+    IMPORT_BATCH_SIZE,
+    INGREDIENT_NAME_LENGTH,
+    MEASUREMENT_UNIT_LENGTH
+)
 from recipes.models import Ingredient
 
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        else:
+            yield None
+
+
+def read_json(file):
+    """Yield objects of JSON array or NDJSON file without loading it whole.
+
+    Malformed object yields None and reading goes on from the next "{".
+    Undecodable text longer than JSON_CHUNK_SIZE is taken as malformed,
+    not incomplete, so buffer stays bounded.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    end = False
+    while not end:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        end = not chunk
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[], \r\n\t':
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not end and len(buffer) - position < JSON_CHUNK_SIZE:
+                    break
+                yield None
+                position = buffer.find('{', position + 1)
+                if position < 0:
+                    position = len(buffer)
+                continue
+            if isinstance(item, dict):
+                yield item.get('name'), item.get('measurement_unit')
+            else:
+                yield None
+        buffer = buffer[position:]
+
+
+def clean(rows):
+    """Yield valid (name, measurement_unit) and None for invalid rows."""
+    for row in rows:
+        if row is None:
+            yield None
+            continue
+        name, measurement_unit = row
+        if (
+            not isinstance(name, str) or not isinstance(measurement_unit, str)
+            or not name.strip() or not measurement_unit.strip()
+            or len(name.strip()) > INGREDIENT_NAME_LENGTH
+            or len(measurement_unit.strip()) > MEASUREMENT_UNIT_LENGTH
+        ):
+            yield None
+            continue
+        yield name.strip(), measurement_unit.strip()
+
+
+class CSVStream(io.RawIOBase):
+    """Readable file of CSV rows, fed to PostgreSQL COPY."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = b''
+        self.line = io.StringIO()
+        self.writer = csv.writer(self.line)
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self.buffer) < len(target):
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+            self.buffer += self.line.getvalue().encode()
+            self.line.seek(0)
+            self.line.truncate()
+        size = min(len(target), len(self.buffer))
+        target[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
 
 class Command(BaseCommand):
-    help = 'Load csv file to table'
+    help = 'Load ingredients from csv or json file with upsert by name'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -16,25 +119,131 @@ class Command(BaseCommand):
             nargs='?',
             type=str
         )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла, по умолчанию по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY на PostgreSQL.'
+        )
 
     def handle(self, *args, **options):
         self.file_path = options['file_path']
+        self.batch_size = options['batch_size']
+        file_format = options['format'] or (
+            'json' if self.file_path.endswith(('.json', '.ndjson')) else 'csv'
+        )
+        self.inserted = self.updated = self.skipped = self.total = 0
+        self.started = time.monotonic()
         try:
             with open(self.file_path, mode='r', encoding='utf-8') as f:
-                reader = csv.DictReader(
-                    f,
-                    fieldnames=['name', 'measurement_unit']
-                )
-                objs = [
-                    Ingredient(
-                        name=row['name'],
-                        measurement_unit=row['measurement_unit']
-                    )
-                    for row in reader
-                ]
+                rows = (read_json if file_format == 'json' else read_csv)(f)
                 self.stdout.write('Загрузка началась.')
-                Ingredient.objects.bulk_create(objs, ignore_conflicts=True)
-                self.stdout.write('Загрузка закончилась.')
+                if connection.vendor == 'postgresql' and not options[
+                    'no_copy'
+                ]:
+                    self.copy_merge(clean(rows))
+                else:
+                    self.upsert(clean(rows))
         except FileNotFoundError as e:
             self.stdout.write(f'{e} Файл не найден, укажите другой путь поcле'
                               f' команды load_ingredients')
+            return
+        bump_catalog_version('ingredient')
+        if self.updated:
+            bump_recipe_card_version()
+        self.stdout.write(
+            f'Загрузка закончилась. Добавлено: {self.inserted}, '
+            f'обновлено: {self.updated}, пропущено: {self.skipped}, '
+            f'{self.rate():.0f} строк/с.'
+        )
+
+    def rate(self):
+        return self.total / max(time.monotonic() - self.started, 1e-9)
+
+    def upsert(self, rows):
+        """Insert new and update changed ingredients batch by batch."""
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            self.total += len(batch)
+            valid = dict(row for row in batch if row is not None)
+            self.skipped += len(batch) - len(valid)
+            with transaction.atomic():
+                existing = {
+                    name: (pk, measurement_unit)
+                    for name, pk, measurement_unit
+                    in Ingredient.objects.filter(
+                        name__in=valid
+                    ).values_list('name', 'id', 'measurement_unit')
+                }
+                new = [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in valid.items()
+                    if name not in existing
+                ]
+                changed = [
+                    Ingredient(id=existing[name][0],
+                               measurement_unit=measurement_unit)
+                    for name, measurement_unit in valid.items()
+                    if name in existing
+                    and existing[name][1] != measurement_unit
+                ]
+                Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+                Ingredient.objects.bulk_update(changed, ('measurement_unit',))
+            self.inserted += len(new)
+            self.updated += len(changed)
+            self.skipped += len(valid) - len(new) - len(changed)
+            self.stdout.write(
+                f'Обработано {self.total} строк, {self.rate():.0f} строк/с.'
+            )
+
+    def copy_merge(self, rows):
+        """COPY rows into temporary table and merge it in one transaction."""
+        table = Ingredient._meta.db_table
+
+        def count_valid(rows):
+            for row in rows:
+                self.total += 1
+                if row is not None:
+                    yield row
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                io.BufferedReader(CSVStream(count_valid(rows)),
+                                  buffer_size=JSON_CHUNK_SIZE)
+            )
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_merge ON COMMIT DROP AS '
+                'SELECT DISTINCT ON (name) name, measurement_unit '
+                'FROM ingredient_import'
+            )
+            cursor.execute(
+                f'UPDATE {table} ingredient '
+                f'SET measurement_unit = merge.measurement_unit '
+                f'FROM ingredient_merge merge '
+                f'WHERE ingredient.name = merge.name '
+                f'AND ingredient.measurement_unit <> merge.measurement_unit'
+            )
+            self.updated = cursor.rowcount
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredient_merge '
+                f'ON CONFLICT (name) DO NOTHING'
+            )
+            self.inserted = cursor.rowcount
+        self.skipped = self.total - self.inserted - self.updated
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShopIngredient
+
+
+class Command(BaseCommand):
+    help = 'Rebuild or verify materialized shop lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only compare with live aggregation, do not rebuild.'
+        )
+
+    def handle(self, *args, **options):
+        rows, drift = ShopIngredient.count_drift()
+        self.stdout.write(f'Строк: {rows}, расхождений: {drift}.')
+        if options['check'] or not drift:
+            return
+        ShopIngredient.rebuild()
+        self.stdout.write('Списки покупок пересобраны.')
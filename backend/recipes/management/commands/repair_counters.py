@@ -0,0 +1,49 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.management.base import BaseCommand
+
+from recipes.models import Favorite, Recipe, Shop
+from users.models import FoodUser, Subscription
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', Shop, 'recipe'),
+    (FoodUser, 'recipes_count', Recipe, 'author'),
+    (FoodUser, 'followers_count', Subscription, 'author'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized favorites, carts, recipes, followers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drifted rows, do not fix them.'
+        )
+
+    def handle(self, *args, **options):
+        for model, field, related_model, fk in COUNTERS:
+            total = Coalesce(
+                Subquery(
+                    related_model.objects.filter(
+                        **{fk: OuterRef('pk')}
+                    ).order_by().values(fk).annotate(
+                        total=Count('pk')
+                    ).values('total')
+                ),
+                0
+            )
+            drifted = model.objects.annotate(total=total).exclude(
+                **{field: F('total')}
+            )
+            drifted_count = drifted.count()
+            if drifted_count and not options['check']:
+                model.objects.filter(
+                    pk__in=drifted.values('pk')
+                ).update(**{field: total})
+            self.stdout.write(
+                f'{model._meta.object_name}.{field}: '
+                f'расхождений {drifted_count}.'
+            )
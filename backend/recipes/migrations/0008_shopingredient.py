@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shop_ingredients(apps, schema_editor):
+    RecipeIngredientsAmount = apps.get_model(
+        'recipes', 'RecipeIngredientsAmount'
+    )
+    ShopIngredient = apps.get_model('recipes', 'ShopIngredient')
+    totals = RecipeIngredientsAmount.objects.values(
+        'ingredient_id',
+        user_id=models.F('recipe__shop_set__user_id'),
+    ).filter(
+        user_id__isnull=False
+    ).annotate(
+        total=models.Sum('amount')
+    ).values_list('user_id', 'ingredient_id', 'total')
+    ShopIngredient.objects.bulk_create(
+        ShopIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=total)
+        for user_id, ingredient_id, total in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_recipe_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'ингредиент списка покупок',
+                'verbose_name_plural': 'Ингредиенты списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shopingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_ingredient_shop'),
+        ),
+        migrations.RunPython(
+            fill_shop_ingredients, migrations.RunPython.noop
+        ),
+    ]
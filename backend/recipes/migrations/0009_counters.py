@@ -0,0 +1,58 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:05
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FoodUser = apps.get_model('users', 'FoodUser')
+    counters = (
+        (Recipe, 'favorites_count',
+         apps.get_model('recipes', 'Favorite'), 'recipe'),
+        (Recipe, 'in_carts_count', apps.get_model('recipes', 'Shop'), 'recipe'),
+        (FoodUser, 'recipes_count', Recipe, 'author'),
+        (FoodUser, 'followers_count',
+         apps.get_model('users', 'Subscription'), 'author'),
+    )
+    for model, field, related_model, fk in counters:
+        model.objects.update(**{field: Coalesce(
+            models.Subquery(
+                related_model.objects.filter(
+                    **{fk: models.OuterRef('pk')}
+                ).order_by().values(fk).annotate(
+                    total=models.Count('pk')
+                ).values('total')
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shopingredient'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во добавлений в список покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-in_carts_count', '-id'], name='recipe_in_carts_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:58
+
+import time
+
+from django.db import migrations, models
+
+
+def create_catalog_versions(apps, schema_editor):
+    CatalogVersion = apps.get_model('recipes', 'CatalogVersion')
+    CatalogVersion.objects.bulk_create(
+        CatalogVersion(catalog=catalog, version=time.time_ns() // 1000)
+        for catalog in ('tag', 'ingredient')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('catalog', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='Каталог')),
+                ('version', models.BigIntegerField(verbose_name='Время изменения в микросекундах')),
+            ],
+            options={
+                'verbose_name': 'версия каталога',
+                'verbose_name_plural': 'Версии каталогов',
+            },
+        ),
+        migrations.RunPython(
+            create_catalog_versions, migrations.RunPython.noop
+        ),
+    ]
@@ -1,11 +1,12 @@
 import short_url
-from django.db import models
+from django.db import connection, models, transaction
 from django.core.validators import (
     MinValueValidator,
     MaxValueValidator
 )
 
 from recipes.const import (
+    CATALOG_NAME_LENGTH,
     DOMAIN,
     TITLE_LENGTH,
     TAG_LENGTH,
@@ -15,7 +16,7 @@ from recipes.const import (
     MAX_VALUE,
     MIN_S_LENGTH
 )
-from users.models import FoodUser as User
+from users.models import CountersModelMixin, FoodUser as User
 
 
 class Ingredient(models.Model):
@@ -65,9 +66,35 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class CatalogVersion(models.Model):
+    """Version of tag or ingredient catalog, time of its last change.
+
+    Stored in the database rather than in cache, so changes made by
+    management commands or another worker reach every process.
+    """
+
+    catalog = models.CharField(
+        max_length=CATALOG_NAME_LENGTH,
+        primary_key=True,
+        verbose_name='Каталог',
+    )
+    version = models.BigIntegerField(
+        verbose_name='Время изменения в микросекундах',
+    )
+
+    class Meta:
+        verbose_name = 'версия каталога'
+        verbose_name_plural = 'Версии каталогов'
+
+    def __str__(self):
+        return f'{self.catalog} {self.version}'
+
+
+class Recipe(CountersModelMixin, models.Model):
     """Recipes model."""
 
+    counter_fields = ('favorites_count', 'in_carts_count')
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -105,11 +132,39 @@ class Recipe(models.Model):
         Tag,
         verbose_name='Теги',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во добавлений в избранное',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во добавлений в список покупок',
+    )
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
+        indexes = (
+            models.Index(
+                fields=('-created_at', '-id'),
+                name='recipe_created_at_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-created_at', '-id'),
+                name='recipe_author_created_at_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=('-in_carts_count', '-id'),
+                name='recipe_in_carts_count_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -158,6 +213,26 @@ class RecipeIngredientsAmount(models.Model):
         return (f'Ингредиент {self.ingredient.name} {self.amount}'
                 f' {self.ingredient.measurement_unit}')
 
+    @classmethod
+    def delete_quietly(cls, recipe_id, ids=None):
+        """Delete recipe rows, or some of them, with one DELETE.
+
+        No signals are sent. For callers that update ShopIngredient
+        themselves, signals in recipes.signals would subtract the amounts
+        again, one query per row.
+        """
+        id_filter = ''
+        params = (recipe_id,)
+        if ids is not None:
+            id_filter = f' AND id IN ({", ".join(["%s"] * len(ids))})'
+            params += tuple(ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {cls._meta.db_table} '
+                f'WHERE recipe_id = %s{id_filter}',
+                params
+            )
+
 
 class UserRecipeBaseModel(models.Model):
     user = models.ForeignKey(
@@ -181,10 +256,112 @@ class UserRecipeBaseModel(models.Model):
             f' {self.user.username}'
         )
 
+    @classmethod
+    @transaction.atomic
+    def add(cls, user_id, recipe_id):
+        """Add recipe with one INSERT ... ON CONFLICT DO NOTHING.
+
+        Signals are not sent: the recipe counter is increased by UPDATE ...
+        RETURNING, which also reads the recipe back. Return the recipe or
+        None when it is already added or does not exist.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} (user_id, recipe_id) '
+                f'SELECT %s, id FROM {Recipe._meta.db_table} WHERE id = %s '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING RETURNING id',
+                (user_id, recipe_id)
+            )
+            if cursor.fetchone() is None:
+                return None
+        counter = cls.recipe_counter
+        return next(iter(Recipe.objects.raw(
+            f'UPDATE {Recipe._meta.db_table} '
+            f'SET {counter} = {counter} + 1 WHERE id = %s '
+            f'RETURNING id, name, image, cooking_time',
+            (recipe_id,)
+        )))
+
+    @classmethod
+    @transaction.atomic
+    def remove(cls, user_id, recipe_id):
+        """Delete row and decrease recipe counter, return True if deleted."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {cls._meta.db_table} '
+                f'WHERE user_id = %s AND recipe_id = %s',
+                (user_id, recipe_id)
+            )
+            if not cursor.rowcount:
+                return False
+        counter = cls.recipe_counter
+        Recipe.objects.filter(
+            pk=recipe_id, **{f'{counter}__gte': 1}
+        ).update(**{counter: models.F(counter) - 1})
+        return True
+
+    @classmethod
+    @transaction.atomic
+    def add_many(cls, user_id, recipe_ids):
+        """Add existing recipes with one INSERT, return ids of added ones.
+
+        Missing recipes are skipped by the INSERT ... SELECT and present
+        ones by ON CONFLICT DO NOTHING. Recipe counters are increased.
+        """
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} (user_id, recipe_id) '
+                f'SELECT %s, id FROM {Recipe._meta.db_table} '
+                f'WHERE id IN ({placeholders}) '
+                f'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+                f'RETURNING recipe_id',
+                (user_id, *recipe_ids)
+            )
+            added = {recipe_id for recipe_id, in cursor.fetchall()}
+        cls.update_counters(added, 1)
+        return added
+
+    @classmethod
+    @transaction.atomic
+    def remove_many(cls, user_id, recipe_ids=None):
+        """Delete rows with one DELETE, return ids of removed recipes.
+
+        All recipes of the user are removed when recipe_ids is None.
+        """
+        recipe_filter = ''
+        params = (user_id,)
+        if recipe_ids is not None:
+            recipe_filter = (
+                f' AND recipe_id IN ({", ".join(["%s"] * len(recipe_ids))})'
+            )
+            params += tuple(recipe_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {cls._meta.db_table} '
+                f'WHERE user_id = %s{recipe_filter} RETURNING recipe_id',
+                params
+            )
+            removed = {recipe_id for recipe_id, in cursor.fetchall()}
+        cls.update_counters(removed, -1)
+        return removed
+
+    @classmethod
+    def update_counters(cls, recipe_ids, delta):
+        if not recipe_ids:
+            return
+        counter = cls.recipe_counter
+        recipes = Recipe.objects.filter(pk__in=recipe_ids)
+        if delta < 0:
+            recipes = recipes.filter(**{f'{counter}__gte': -delta})
+        recipes.update(**{counter: models.F(counter) + delta})
+
 
 class Favorite(UserRecipeBaseModel):
     """Model for favorite recipe."""
 
+    recipe_counter = 'favorites_count'
+
     class Meta(UserRecipeBaseModel.Meta):
         verbose_name = 'избранное'
         verbose_name_plural = 'Избранное'
@@ -202,6 +379,8 @@ class Favorite(UserRecipeBaseModel):
 class Shop(UserRecipeBaseModel):
     """Model for user shop list."""
 
+    recipe_counter = 'in_carts_count'
+
     class Meta:
         verbose_name = 'список покупок'
         verbose_name_plural = 'Списки покупок'
@@ -215,3 +394,278 @@ class Shop(UserRecipeBaseModel):
                 )
             ),
         )
+
+
+class ShopIngredient(models.Model):
+    """Materialized total of ingredient in user shop list.
+
+    Kept in sync with Shop rows and ingredient amounts of recipes in carts,
+    see add_recipes(), remove_recipes() and their per user versions. Shop
+    rows and recipe ingredient amounts changed through the ORM, including
+    cascades, are handled by signals in recipes.signals.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shop_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списков покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_user_ingredient_shop'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount} у {self.user}'
+
+    @classmethod
+    def add_recipes(cls, recipe_id):
+        """Add recipe ingredients to shop lists having the recipe.
+
+        One INSERT ... SELECT ... ON CONFLICT DO UPDATE.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} '
+                f'(user_id, ingredient_id, amount) '
+                f'SELECT shop.user_id, amounts.ingredient_id, amounts.amount '
+                f'FROM {Shop._meta.db_table} shop '
+                f'JOIN {RecipeIngredientsAmount._meta.db_table} amounts '
+                f'ON amounts.recipe_id = shop.recipe_id '
+                f'WHERE shop.recipe_id = %s '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {cls._meta.db_table}.amount + excluded.amount',
+                (recipe_id,)
+            )
+
+    @classmethod
+    def add_user_recipes(cls, user_id, recipe_ids):
+        """Add ingredients of recipes to one user shop list."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} '
+                f'(user_id, ingredient_id, amount) '
+                f'SELECT %s, ingredient_id, SUM(amount) '
+                f'FROM {RecipeIngredientsAmount._meta.db_table} '
+                f'WHERE recipe_id IN ({", ".join(["%s"] * len(recipe_ids))}) '
+                f'GROUP BY ingredient_id '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {cls._meta.db_table}.amount + excluded.amount',
+                (user_id, *recipe_ids)
+            )
+
+    @classmethod
+    def add_amount(cls, recipe_id, ingredient_id, amount):
+        """Add amount of ingredient to shop lists having the recipe.
+
+        Negative amount is subtracted, emptied rows are deleted.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} '
+                f'(user_id, ingredient_id, amount) '
+                f'SELECT user_id, %s, %s FROM {Shop._meta.db_table} '
+                f'WHERE recipe_id = %s '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {cls._meta.db_table}.amount + excluded.amount',
+                (ingredient_id, amount, recipe_id)
+            )
+        if amount < 0:
+            cls.objects.filter(
+                ingredient_id=ingredient_id, amount__lte=0
+            ).delete()
+
+    @classmethod
+    def remove_recipes(cls, recipe_id):
+        """Subtract recipe ingredients from shop lists having the recipe."""
+        cls.subtract(
+            cls.objects.filter(
+                ingredient__recipeingredientsamount__recipe_id=recipe_id,
+                user__shop_set__recipe_id=recipe_id
+            ),
+            (recipe_id,)
+        )
+
+    @classmethod
+    def remove_user_recipes(cls, user_id, recipe_ids):
+        """Subtract ingredients of recipes from one user shop list."""
+        cls.subtract(
+            cls.objects.filter(
+                user_id=user_id,
+                ingredient__recipeingredientsamount__recipe_id__in=recipe_ids
+            ),
+            recipe_ids
+        )
+
+    @staticmethod
+    def subtract(shop_ingredients, recipe_ids):
+        shop_ingredients.update(
+            amount=models.F('amount') - models.Subquery(
+                RecipeIngredientsAmount.objects.filter(
+                    recipe_id__in=recipe_ids,
+                    ingredient_id=models.OuterRef('ingredient_id')
+                ).values('ingredient_id').annotate(
+                    total=models.Sum('amount')
+                ).values('total')
+            )
+        )
+        shop_ingredients.filter(amount__lte=0).delete()
+
+    @classmethod
+    def count_drift(cls):
+        """Return count of live totals and of stored rows differing from them.
+
+        Compared in SQL, rows are not loaded into Python.
+        """
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*), COALESCE(SUM(CASE '
+                f'WHEN stored.amount = live.total THEN 0 ELSE 1 END), 0) '
+                f'FROM ({cls.get_live_totals_sql()}) live '
+                f'LEFT JOIN {table} stored '
+                f'ON stored.user_id = live.user_id '
+                f'AND stored.ingredient_id = live.ingredient_id'
+            )
+            rows, drift = cursor.fetchone()
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {table} '
+                f'WHERE NOT EXISTS ({cls.get_in_shop_sql()})'
+            )
+            return rows, drift + cursor.fetchone()[0]
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls):
+        """Make stored rows equal to live totals.
+
+        DELETE ... WHERE NOT EXISTS drops rows of ingredients no longer in
+        shop lists, INSERT ... SELECT ... ON CONFLICT DO UPDATE adds missing
+        rows and fixes drifted amounts, equal rows are left as is.
+        """
+        table = cls._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} '
+                f'WHERE NOT EXISTS ({cls.get_in_shop_sql()})'
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'SELECT user_id, ingredient_id, total '
+                f'FROM ({cls.get_live_totals_sql()}) live WHERE 1 = 1 '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = excluded.amount '
+                f'WHERE {table}.amount <> excluded.amount'
+            )
+
+    @staticmethod
+    def get_live_totals_sql():
+        """SQL of live totals, one row per user and ingredient."""
+        return (
+            f'SELECT shop.user_id, amounts.ingredient_id, '
+            f'SUM(amounts.amount) AS total '
+            f'FROM {Shop._meta.db_table} shop '
+            f'JOIN {RecipeIngredientsAmount._meta.db_table} amounts '
+            f'ON amounts.recipe_id = shop.recipe_id '
+            f'GROUP BY shop.user_id, amounts.ingredient_id'
+        )
+
+    @classmethod
+    def get_in_shop_sql(cls):
+        """SQL matching Shop rows that hold the stored ingredient."""
+        table = cls._meta.db_table
+        return (
+            f'SELECT 1 FROM {Shop._meta.db_table} shop '
+            f'JOIN {RecipeIngredientsAmount._meta.db_table} amounts '
+            f'ON amounts.recipe_id = shop.recipe_id '
+            f'WHERE shop.user_id = {table}.user_id '
+            f'AND amounts.ingredient_id = {table}.ingredient_id'
+        )
+
+    @classmethod
+    def get_live_totals(cls):
+        """Return totals computed from Shop and recipe ingredient amounts."""
+        return RecipeIngredientsAmount.objects.values(
+            'ingredient_id',
+            user_id=models.F('recipe__shop_set__user_id'),
+        ).filter(
+            user_id__isnull=False
+        ).annotate(
+            total=models.Sum('amount')
+        ).values_list('user_id', 'ingredient_id', 'total')
+
+
+class SimilarRecipe(models.Model):
+    """Precomputed neighbour of recipe by ingredients and tags.
+
+    Filled by compute_similar_recipes, read by /recipes/{id}/similar/.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_recipe_similar'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class RecipeFingerprint(models.Model):
+    """Digest of recipe ingredients and tags at last similarity run.
+
+    compute_similar_recipes refreshes only recipes whose digest changed.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fingerprint',
+        verbose_name='Рецепт',
+    )
+    digest = models.BigIntegerField(
+        verbose_name='Дайджест ингредиентов и тегов',
+    )
+
+    class Meta:
+        verbose_name = 'отпечаток рецепта'
+        verbose_name_plural = 'Отпечатки рецептов'
+
+    def __str__(self):
+        return f'{self.recipe} {self.digest}'
@@ -0,0 +1,106 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredientsAmount,
+    Shop,
+    ShopIngredient
+)
+from users.models import FoodUser, Subscription
+
+# sender: (model holding counter, foreign key attname, counter field)
+# Favorite, Shop and Subscription add() and remove() bypass signals and
+# update the counters themselves.
+COUNTERS = {
+    Favorite: (Recipe, 'recipe_id', Favorite.recipe_counter),
+    Shop: (Recipe, 'recipe_id', Shop.recipe_counter),
+    Recipe: (FoodUser, 'author_id', 'recipes_count'),
+    Subscription: (FoodUser, 'author_id', 'followers_count'),
+}
+
+
+def update_counter(sender, instance, delta):
+    """Change counter of related object with atomic UPDATE ... SET F()."""
+    model, attname, field = COUNTERS[sender]
+    objects = model.objects.filter(pk=getattr(instance, attname))
+    if delta < 0:
+        objects = objects.filter(**{f'{field}__gte': -delta})
+    objects.update(**{field: F(field) + delta})
+
+
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        update_counter(sender, instance, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    update_counter(sender, instance, -1)
+
+
+for sender in COUNTERS:
+    post_save.connect(count_created, sender=sender)
+    post_delete.connect(count_deleted, sender=sender)
+
+
+# Shop rows and recipe ingredient amounts saved or deleted through the
+# ORM, e.g. by admin inlines or by cascades from deleted recipes and
+# users, keep ShopIngredient in sync. Both are handled in post_delete:
+# whichever of them a cascade deletes first subtracts the amounts, the
+# other finds nothing left to subtract.
+def unshop_replaced(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    previous = Shop.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'recipe_id'
+    ).first()
+    instance._shop_replaced = previous not in (
+        None, (instance.user_id, instance.recipe_id)
+    )
+    if instance._shop_replaced:
+        ShopIngredient.remove_user_recipes(previous[0], (previous[1],))
+
+
+def shop_saved(sender, instance, created, **kwargs):
+    if created or getattr(instance, '_shop_replaced', False):
+        ShopIngredient.add_user_recipes(
+            instance.user_id, (instance.recipe_id,)
+        )
+
+
+def unshop_deleted(sender, instance, **kwargs):
+    ShopIngredient.remove_user_recipes(instance.user_id, (instance.recipe_id,))
+
+
+def unshop_changed_amount(sender, instance, **kwargs):
+    instance._previous_amount = None
+    if instance.pk is not None:
+        instance._previous_amount = RecipeIngredientsAmount.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+def amount_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_amount', None)
+    current = (instance.recipe_id, instance.ingredient_id, instance.amount)
+    if previous == current:
+        return
+    if previous is not None:
+        recipe_id, ingredient_id, amount = previous
+        ShopIngredient.add_amount(recipe_id, ingredient_id, -amount)
+    ShopIngredient.add_amount(*current)
+
+
+def amount_deleted(sender, instance, **kwargs):
+    ShopIngredient.add_amount(
+        instance.recipe_id, instance.ingredient_id, -instance.amount
+    )
+
+
+pre_save.connect(unshop_replaced, sender=Shop)
+post_save.connect(shop_saved, sender=Shop)
+post_delete.connect(unshop_deleted, sender=Shop)
+pre_save.connect(unshop_changed_amount, sender=RecipeIngredientsAmount)
+post_save.connect(amount_saved, sender=RecipeIngredientsAmount)
+post_delete.connect(amount_deleted, sender=RecipeIngredientsAmount)
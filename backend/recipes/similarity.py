@@ -0,0 +1,132 @@
+import hashlib
+from itertools import chain
+
+import numpy as np
+
+from recipes.const import SIMILAR_MAX_DF
+from recipes.models import Recipe, RecipeIngredientsAmount
+
+
+def fetch_features(queryset, key, kind):
+    """Return (recipe id, feature) pairs, ingredients even, tags odd.
+
+    Feature numbers do not depend on catalog sizes, so digests of
+    unchanged recipes stay the same between runs.
+    """
+    pairs = np.fromiter(
+        chain.from_iterable(
+            queryset.values_list('recipe_id', key).iterator()
+        ),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    pairs[:, 1] = pairs[:, 1] * 2 + kind
+    return pairs
+
+
+class RecipeVectors:
+    """Sparse recipe x feature matrix of ingredients and tags.
+
+    Both orientations are kept in CSR form: features of a recipe and
+    recipes of a feature, common features are also kept as dense masks.
+    Features are weighted by squared smoothed idf, similarity is cosine
+    of weighted binary vectors. Candidates come from features found in at
+    most SIMILAR_MAX_DF of recipes, common features like salt or tags
+    only add to candidate scores unless rare ones give too few candidates.
+    """
+
+    def __init__(self, pairs):
+        recipes, features = pairs[:, 0], pairs[:, 1]
+        size = int(recipes.max()) + 1 if len(pairs) else 0
+        by_recipe = np.lexsort((features, recipes))
+        self.features = features[by_recipe].astype(np.int32)
+        self.recipe_starts = np.concatenate(
+            ([0], np.cumsum(np.bincount(recipes, minlength=size)))
+        )
+        by_feature = np.lexsort((recipes, features))
+        self.postings = recipes[by_feature].astype(np.int32)
+        self.df = np.bincount(features)
+        self.feature_starts = np.concatenate(([0], np.cumsum(self.df)))
+        self.recipe_ids = np.flatnonzero(np.diff(self.recipe_starts))
+        self.max_df = max(1, SIMILAR_MAX_DF * len(self.recipe_ids))
+        self.weights = np.log1p(
+            len(self.recipe_ids) / np.maximum(self.df, 1)
+        ) ** 2
+        self.norms = np.sqrt(np.bincount(
+            recipes, weights=self.weights[features], minlength=size
+        ))
+        self.common = {}
+        for feature in np.flatnonzero(self.df > self.max_df).tolist():
+            self.common[feature] = np.zeros(size, dtype=bool)
+            self.common[feature][self.get_posting(feature)] = True
+
+    @classmethod
+    def load(cls):
+        return cls(np.concatenate((
+            fetch_features(
+                RecipeIngredientsAmount.objects.all(), 'ingredient_id', 0
+            ),
+            fetch_features(Recipe.tags.through.objects.all(), 'tag_id', 1),
+        )))
+
+    def get_features(self, recipe_id):
+        if recipe_id + 1 >= len(self.recipe_starts):
+            return self.features[:0]
+        return self.features[
+            self.recipe_starts[recipe_id]:self.recipe_starts[recipe_id + 1]
+        ]
+
+    def get_posting(self, feature):
+        return self.postings[
+            self.feature_starts[feature]:self.feature_starts[feature + 1]
+        ]
+
+    def get_digest(self, recipe_id):
+        return int.from_bytes(
+            hashlib.blake2b(
+                self.get_features(recipe_id).tobytes(), digest_size=8
+            ).digest(),
+            'big',
+            signed=True
+        )
+
+    def get_scores(self, recipe_id, count):
+        """Return candidate recipe ids and their similarity to recipe.
+
+        Rarest features are taken as candidate sources until there are
+        more than count candidates or the rest of features are common.
+        """
+        features = self.get_features(recipe_id)
+        if not len(features):
+            return self.postings[:0], np.empty(0)
+        features = features[np.argsort(self.df[features], kind='stable')]
+        taken = max(1, int(np.searchsorted(
+            self.df[features], self.max_df, side='right'
+        )))
+        postings = [self.get_posting(feature) for feature in features[:taken]]
+        candidates, inverse = np.unique(
+            np.concatenate(postings), return_inverse=True
+        )
+        while len(candidates) <= count and taken < len(features):
+            postings.append(self.get_posting(features[taken]))
+            taken += 1
+            candidates, inverse = np.unique(
+                np.concatenate(postings), return_inverse=True
+            )
+        scores = np.bincount(inverse, weights=np.repeat(
+            self.weights[features[:taken]],
+            [len(posting) for posting in postings]
+        ))
+        for feature in features[taken:]:
+            scores += self.common[feature][candidates] * self.weights[feature]
+        scores /= self.norms[candidates] * self.norms[recipe_id]
+        other = candidates != recipe_id
+        return candidates[other], scores[other]
+
+    def get_neighbours(self, recipe_id, count):
+        """Return top count similar recipe ids and scores, best first."""
+        candidates, scores = self.get_scores(recipe_id, count)
+        if len(candidates) > count:
+            top = np.argpartition(-scores, count - 1)[:count]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((-candidates, -scores))
+        return candidates[order], scores[order]
@@ -0,0 +1,232 @@
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.tests import create_recipe, create_user
+from recipes.management.commands import load_ingredients
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    Shop,
+    ShopIngredient,
+    Tag
+)
+from users.models import FoodUser, Subscription
+
+
+class LoadIngredientsTests(TestCase):
+
+    def load(self, content, suffix='.json'):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8', delete=False
+        ) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        stdout = io.StringIO()
+        call_command('load_ingredients', file.name, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_malformed_object_skipped(self):
+        output = self.load(
+            '[{"name": "соль", "measurement_unit": "г"},\n'
+            '{"name": "сахар", "measurement_unit": },\n'
+            '{"name": "мука", "measurement_unit": "г"}]'
+        )
+        self.assertIn('Добавлено: 2, обновлено: 0, пропущено: 1', output)
+        self.assertCountEqual(
+            Ingredient.objects.values_list('name', flat=True),
+            ('соль', 'мука')
+        )
+
+    def test_truncated_file_tail_skipped(self):
+        output = self.load(
+            '{"name": "соль", "measurement_unit": "г"}\n'
+            '{"name": "мука", "measurement_unit"',
+            suffix='.ndjson'
+        )
+        self.assertIn('Добавлено: 1, обновлено: 0, пропущено: 1', output)
+
+    def test_read_json_resyncs_across_chunks(self):
+        items = [
+            {'name': f'ингредиент {number}', 'measurement_unit': 'г'}
+            for number in range(500)
+        ]
+        content = '\n'.join(
+            '{"name": "сломан", "measurement_unit": ]' if number == 100
+            else json.dumps(item, ensure_ascii=False)
+            for number, item in enumerate(items)
+        )
+        with mock.patch.object(load_ingredients, 'JSON_CHUNK_SIZE', 256):
+            rows = list(load_ingredients.read_json(io.StringIO(content)))
+        self.assertEqual(rows.count(None), 1)
+        self.assertEqual(len(rows), 500)
+        self.assertEqual(rows[101], ('ингредиент 101', 'г'))
+
+
+class GenerateDatasetTests(TestCase):
+
+    def test_orm_inserts_after_generation(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(30)
+        )
+        call_command(
+            'generate_dataset', users=5, recipes=20, stdout=io.StringIO()
+        )
+        user = FoodUser.objects.create_user(
+            email='new@example.com', username='new', first_name='Имя',
+            last_name='Фамилия', password='test-Passw0rd'
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='Новый', text='Описание', cooking_time=5,
+            image='recipes/images/test.png'
+        )
+        self.assertEqual(FoodUser.objects.count(), 6)
+        self.assertEqual(recipe.id, Recipe.objects.count())
+
+
+class ExportImportTests(TestCase):
+
+    def snapshot(self):
+        return {
+            'recipes': sorted(
+                (
+                    recipe.author.email, recipe.name,
+                    tuple(recipe.tags.order_by('slug').values_list(
+                        'slug', flat=True
+                    )),
+                    tuple(recipe.ingredient_amount.order_by(
+                        'ingredient__name'
+                    ).values_list(
+                        'ingredient__name', 'amount'
+                    ))
+                )
+                for recipe in Recipe.objects.all()
+            ),
+            'favorites': sorted(Favorite.objects.values_list(
+                'user__email', 'recipe__name'
+            )),
+            'shop': sorted(Shop.objects.values_list(
+                'user__email', 'recipe__name'
+            )),
+            'subscriptions': sorted(Subscription.objects.values_list(
+                'user__email', 'author__email'
+            )),
+        }
+
+    def test_round_trip_with_taken_usernames(self):
+        long_username = 'a' * 150
+        author = FoodUser.objects.create_user(
+            email='long@example.com', username=long_username,
+            first_name='Имя', last_name='Фамилия', password='test-Passw0rd'
+        )
+        user = create_user(1)
+        tags = [
+            Tag.objects.create(name=f'Тег {number}', slug=f'tag{number}')
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        recipes = [
+            create_recipe(author, ingredients, tags, 0),
+            create_recipe(user, ingredients[1:], tags[:1], 1),
+        ]
+        Favorite.add(user.id, recipes[0].id)
+        Shop.add_many(user.id, [recipe.id for recipe in recipes])
+        Subscription.add(user.id, author.id)
+        expected = self.snapshot()
+        with tempfile.NamedTemporaryFile(
+            suffix='.ndjson', delete=False
+        ) as file:
+            pass
+        self.addCleanup(os.remove, file.name)
+        call_command(
+            'export_recipes', file.name, skip_images=True,
+            stderr=io.StringIO()
+        )
+
+        FoodUser.objects.all().delete()
+        suffix = f'_{author.id}'
+        taken = [
+            long_username, long_username[:-len(suffix)] + suffix, 'user1'
+        ]
+        for number, username in enumerate(taken):
+            FoodUser.objects.create_user(
+                email=f'other{number}@example.com', username=username,
+                password='test-Passw0rd'
+            )
+        call_command(
+            'import_recipes', file.name, skip_images=True,
+            stdout=io.StringIO(), stderr=io.StringIO()
+        )
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(
+            FoodUser.objects.get(email='long@example.com').username,
+            long_username[:-len(suffix) - 2] + suffix + '_2'
+        )
+        self.assertEqual(
+            FoodUser.objects.get(email='user1@example.com').username,
+            f'user1_{user.id}'
+        )
+
+
+class RebuildShopListsTests(TestCase):
+
+    def rebuild(self, **options):
+        stdout = io.StringIO()
+        call_command('rebuild_shop_lists', stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def stored(self):
+        return sorted(ShopIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ))
+
+    def test_drift_fixed(self):
+        author, user = create_user(1), create_user(2)
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        tag = Tag.objects.create(name='Тег', slug='tag')
+        recipes = [
+            create_recipe(author, ingredients[:3], (tag,), number)
+            for number in range(2)
+        ]
+        for shopper in (author, user):
+            for recipe in recipes:
+                Shop.objects.create(user=shopper, recipe=recipe)
+        live = sorted(ShopIngredient.get_live_totals())
+        self.assertEqual(self.stored(), live)
+        self.assertIn('Строк: 6, расхождений: 0.', self.rebuild())
+
+        ShopIngredient.objects.filter(
+            user=user, ingredient=ingredients[0]
+        ).update(amount=100)
+        ShopIngredient.objects.filter(
+            user=author, ingredient=ingredients[1]
+        ).delete()
+        ShopIngredient.objects.create(
+            user=user, ingredient=ingredients[3], amount=5
+        )
+        drifted = self.stored()
+        self.assertIn(
+            'Строк: 6, расхождений: 3.', self.rebuild(check=True)
+        )
+        self.assertEqual(self.stored(), drifted)
+        self.assertIn('пересобраны', self.rebuild())
+        self.assertEqual(self.stored(), live)
+        self.assertIn('Строк: 6, расхождений: 0.', self.rebuild())
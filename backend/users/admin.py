@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Count
 
 from recipes.models import Shop
 from users.models import FoodUser, Subscription
@@ -11,6 +12,7 @@ class SubscriptionInline(admin.TabularInline):
     model = Subscription
     fk_name = 'user'
     extra = 0
+    autocomplete_fields = ('author',)
 
 
 class ShopInline(admin.TabularInline):
@@ -19,6 +21,7 @@ class ShopInline(admin.TabularInline):
     model = Shop
     fk_name = "user"
     extra = 0
+    autocomplete_fields = ('recipe',)
 
 
 class FoodUserAdmin(UserAdmin):
@@ -67,13 +70,24 @@ class FoodUserAdmin(UserAdmin):
         ShopInline,
     )
 
-    @admin.display(description='Кол-во подписок пользователя')
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            subscriptions_count=Count('user_subscriptions')
+        )
+
+    @admin.display(
+        description='Кол-во подписок пользователя',
+        ordering='subscriptions_count'
+    )
     def get_subscriptions(self, obj):
-        return obj.user_subscriptions.count()
+        return obj.subscriptions_count
 
-    @admin.display(description='Кол-во рецептов пользователя')
+    @admin.display(
+        description='Кол-во рецептов пользователя',
+        ordering='recipes_count'
+    )
     def get_recipes(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
 
 class SubscriptionAdmin(admin.ModelAdmin):
@@ -82,9 +96,11 @@ class SubscriptionAdmin(admin.ModelAdmin):
         'author',
     )
     list_editable = ('author',)
-    search_fields = ('user',)
-    list_filter = ('user',)
+    search_fields = ('user__email', 'user__username', 'author__email',
+                     'author__username')
     list_display_links = ('user',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 admin.site.register(FoodUser, FoodUserAdmin)
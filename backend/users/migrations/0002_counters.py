@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-18 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooduser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='fooduser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Кол-во рецептов'),
+        ),
+        migrations.AddIndex(
+            model_name='fooduser',
+            index=models.Index(fields=['-recipes_count', '-id'], name='user_recipes_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fooduser',
+            index=models.Index(fields=['-followers_count', '-id'], name='user_followers_count_idx'),
+        ),
+    ]
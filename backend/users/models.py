@@ -1,13 +1,39 @@
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
 
 from users.const import MAX_EMAIL_LENGTH, MAX_LENGHT_CHAR
 
 
-class FoodUser(AbstractUser):
+class CountersModelMixin:
+    """Leave counter fields out of UPDATE made by save().
+
+    Counters are changed by UPDATE ... SET counter = counter + 1, an
+    instance read before that would write its stale values back.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class FoodUser(CountersModelMixin, AbstractUser):
     """Redefined user model."""
 
+    counter_fields = ('recipes_count', 'followers_count')
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
 
@@ -30,18 +56,34 @@ class FoodUser(AbstractUser):
         blank=True,
         verbose_name='Аватар',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во подписчиков',
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = (
+            models.Index(
+                fields=('-recipes_count', '-id'),
+                name='user_recipes_count_idx'
+            ),
+            models.Index(
+                fields=('-followers_count', '-id'),
+                name='user_followers_count_idx'
+            ),
+        )
 
     def __str__(self):
         return self.email
 
-    @property
-    def recipes_count(self):
-        return self.recipes.count()
-
 
 class Subscription(models.Model):
     """Model for following."""
@@ -72,3 +114,45 @@ class Subscription(models.Model):
     def __str__(self):
         return (f'{self.user.username} subscribed'
                 f' on {self.author.username}')
+
+    @classmethod
+    @transaction.atomic
+    def add(cls, user_id, author_id):
+        """Subscribe with one INSERT ... ON CONFLICT DO NOTHING.
+
+        Signals are not sent: followers_count is increased by UPDATE ...
+        RETURNING, which also reads the author back. Return the author or
+        None when subscription exists or author does not exist.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {cls._meta.db_table} (user_id, author_id) '
+                f'SELECT %s, id FROM {FoodUser._meta.db_table} WHERE id = %s '
+                f'ON CONFLICT (user_id, author_id) DO NOTHING RETURNING id',
+                (user_id, author_id)
+            )
+            if cursor.fetchone() is None:
+                return None
+        return next(iter(FoodUser.objects.raw(
+            f'UPDATE {FoodUser._meta.db_table} '
+            f'SET followers_count = followers_count + 1 WHERE id = %s '
+            f'RETURNING *',
+            (author_id,)
+        )))
+
+    @classmethod
+    @transaction.atomic
+    def remove(cls, user_id, author_id):
+        """Unsubscribe and decrease followers_count, True if deleted."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {cls._meta.db_table} '
+                f'WHERE user_id = %s AND author_id = %s',
+                (user_id, author_id)
+            )
+            if not cursor.rowcount:
+                return False
+        FoodUser.objects.filter(
+            pk=author_id, followers_count__gte=1
+        ).update(followers_count=models.F('followers_count') - 1)
+        return True
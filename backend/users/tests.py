@@ -0,0 +1,197 @@
+import threading
+import time
+from unittest import mock
+
+from django.db import DatabaseError, OperationalError, connection
+from django.db.models import Manager, QuerySet
+from django.test import TransactionTestCase
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.tests import create_recipe, create_user
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Shop,
+    ShopIngredient,
+    Tag
+)
+from users.models import Subscription
+
+THREADS = 8
+RETRIES = 100
+
+
+class RaceTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = create_user(1)
+        self.author = create_user(2)
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        tag = Tag.objects.create(name='Тег', slug='tag')
+        self.recipes = [
+            create_recipe(self.author, (ingredient,), (tag,), number)
+            for number in range(2)
+        ]
+
+    def run_concurrently(self, function):
+        """Call function 5 times from each of THREADS threads at once."""
+        barrier = threading.Barrier(THREADS)
+        results = []
+        errors = []
+
+        def run():
+            try:
+                barrier.wait()
+                for _ in range(5):
+                    for attempt in range(RETRIES):
+                        try:
+                            results.append(function())
+                            break
+                        except OperationalError as error:
+                            # SQLite lets one writer at a time in.
+                            if attempt == RETRIES - 1:
+                                errors.append(error)
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), THREADS * 5)
+        return results
+
+    def assertSubscribed(self, subscribed):
+        self.assertEqual(
+            Subscription.objects.filter(
+                user=self.user, author=self.author
+            ).count(),
+            int(subscribed)
+        )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, int(subscribed))
+
+    def assertAdded(self, model, recipes):
+        for recipe in self.recipes:
+            self.assertEqual(
+                model.objects.filter(user=self.user, recipe=recipe).count(),
+                int(recipe in recipes)
+            )
+            recipe.refresh_from_db()
+            self.assertEqual(
+                getattr(recipe, model.recipe_counter), int(recipe in recipes)
+            )
+
+    def test_concurrent_add(self):
+        results = self.run_concurrently(
+            lambda: Subscription.add(self.user.id, self.author.id)
+        )
+        self.assertEqual(
+            sum(result is not None for result in results), 1
+        )
+        self.assertSubscribed(True)
+
+    def test_concurrent_remove(self):
+        Subscription.add(self.user.id, self.author.id)
+        results = self.run_concurrently(
+            lambda: Subscription.remove(self.user.id, self.author.id)
+        )
+        self.assertEqual(results.count(True), 1)
+        self.assertSubscribed(False)
+
+    def test_repeated_add_and_remove(self):
+        self.assertIsNotNone(Subscription.add(self.user.id, self.author.id))
+        self.assertIsNone(Subscription.add(self.user.id, self.author.id))
+        self.assertSubscribed(True)
+        self.assertTrue(Subscription.remove(self.user.id, self.author.id))
+        self.assertFalse(Subscription.remove(self.user.id, self.author.id))
+        self.assertSubscribed(False)
+
+    def test_failed_counter_update_rolls_back(self):
+        recipe = self.recipes[0]
+        for add in (
+            lambda: Favorite.add(self.user.id, recipe.id),
+            lambda: Subscription.add(self.user.id, self.author.id),
+        ):
+            with mock.patch.object(
+                Manager, 'raw', side_effect=DatabaseError
+            ), self.assertRaises(DatabaseError):
+                add()
+        self.assertAdded(Favorite, ())
+        self.assertSubscribed(False)
+        Shop.add_many(self.user.id, [recipe.id])
+        Subscription.add(self.user.id, self.author.id)
+        for remove in (
+            lambda: Shop.remove_many(self.user.id, [recipe.id]),
+            lambda: Subscription.remove(self.user.id, self.author.id),
+        ):
+            with mock.patch.object(
+                QuerySet, 'update', side_effect=DatabaseError
+            ), self.assertRaises(DatabaseError):
+                remove()
+        self.assertAdded(Shop, (recipe,))
+        self.assertSubscribed(True)
+
+    def test_concurrent_favorite_add_and_remove(self):
+        recipe = self.recipes[0]
+        results = self.run_concurrently(
+            lambda: Favorite.add(self.user.id, recipe.id)
+        )
+        self.assertEqual(
+            sum(result is not None for result in results), 1
+        )
+        self.assertAdded(Favorite, (recipe,))
+        results = self.run_concurrently(
+            lambda: Favorite.remove(self.user.id, recipe.id)
+        )
+        self.assertEqual(results.count(True), 1)
+        self.assertAdded(Favorite, ())
+
+    def test_concurrent_shop_add_many_and_remove_many(self):
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        results = self.run_concurrently(
+            lambda: Shop.add_many(self.user.id, recipe_ids)
+        )
+        self.assertCountEqual(
+            [recipe_id for added in results for recipe_id in added],
+            recipe_ids
+        )
+        self.assertAdded(Shop, self.recipes)
+        results = self.run_concurrently(
+            lambda: Shop.remove_many(self.user.id, recipe_ids)
+        )
+        self.assertCountEqual(
+            [recipe_id for removed in results for recipe_id in removed],
+            recipe_ids
+        )
+        self.assertAdded(Shop, ())
+
+    def post(self, url):
+        # Test client re-raises exceptions of requests in other threads,
+        # the view is called directly.
+        request = APIRequestFactory().post(url)
+        force_authenticate(request, self.user)
+        match = resolve(url)
+        return match.func(request, *match.args, **match.kwargs).status_code
+
+    def test_concurrent_duplicate_post(self):
+        recipe = self.recipes[0]
+        for url, model in (
+            (f'/api/recipes/{recipe.id}/favorite/', Favorite),
+            (f'/api/recipes/{recipe.id}/shopping_cart/', Shop),
+        ):
+            with self.subTest(url=url):
+                statuses = self.run_concurrently(lambda: self.post(url))
+                self.assertEqual(statuses.count(201), 1)
+                self.assertEqual(statuses.count(400), len(statuses) - 1)
+                self.assertAdded(model, (recipe,))
+        self.assertEqual(
+            list(ShopIngredient.objects.values_list('user_id', 'amount')),
+            [(self.user.id, 1)]
+        )